@@ -0,0 +1,239 @@
+from sys import argv
+from os.path import isfile, join
+from json import load
+from csv import DictWriter
+from itertools import product
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+from lib.topology import Topology, build_topology, pathloss_models, pylon_bandwidth
+from lib.arg_parser import parse_arguments
+from lib.algorithms import greedy_allocation
+from lib.util import sample_users
+from lib.writer import reset_output_files, output_folder
+
+
+scenario_defaults = {
+    "pathloss": "oh",
+    "algorithm": "greedy",
+    "interference": False,
+    "cell": 1000.,
+    "seed": None
+}
+"""Default values of the optional scenario fields."""
+
+table_columns = [
+    "scenario", "equipments", "towers", "antennas", "pathloss", "algorithm", "interference", "cell", "seed",
+    "users", "served_users", "duration",
+    "pylon_x", "pylon_y", "antenna", "pylon_users", "used_bandwidth", "total_bandwidth"
+]
+"""Columns of the output table, one row per pylon of each scenario."""
+
+
+def expand_manifest(manifest:list[dict[str,object]]) -> list[dict[str,object]]:
+    """Expand a manifest into the list of scenarios to run.
+
+    Each entry of the manifest holds the `equipments`, `towers` and `antennas` JSON
+    files and optionally the `pathloss`, `algorithm`, `interference`, `cell` (of the hierarchical
+    algorithm) and `seed` to use.
+    Any field given as a list is swept: the entry is expanded to the cartesian
+    product of all its list fields. A scenario is named after the `name` of its entry
+    (or its index in the manifest), followed by its swept values when the entry has some.
+
+    Parameters
+    ----------
+    manifest
+        JSON loaded manifest.
+
+    Returns
+    -------
+    Scenarios with all their fields set.
+    """
+    scenarios = []
+    for i,entry in enumerate(manifest):
+        entry = scenario_defaults | entry
+        keys = list(entry.keys())
+        swept = [ k for k,v in entry.items() if isinstance(v, list) ]
+        values = [ v if isinstance(v, list) else [v] for v in entry.values() ]
+        for combination in product(*values):
+            scenario = dict(zip(keys, combination))
+            name = str(scenario.get("name", i))
+            if swept:
+                name += "[" + ",".join(f"{k}={scenario[k]}" for k in swept) + "]"
+            scenario["scenario"] = name
+            scenarios.append(scenario)
+    return scenarios
+
+
+def resample_equipments(equipments:list[object], seed:int) -> list[object]:
+    """Draw new random positions for the UEs of an equipments file.
+
+    The UEs keep their other fields (demand...) and are sampled uniformly over the
+    bounding box of the original positions, so that the seeds of a sweep give
+    different instances of the same region and load.
+
+    Parameters
+    ----------
+    equipments
+        JSON loaded array of UEs.
+    seed
+        Random seed of the positions.
+
+    Returns
+    -------
+    JSON like array of the resampled UEs.
+    """
+    np.random.seed(seed)
+    xs = [ u["pos"]["x"] for u in equipments ]
+    ys = [ u["pos"]["y"] for u in equipments ]
+    positions = sample_users((max(xs) - min(xs), max(ys) - min(ys)), len(equipments)) if equipments else []
+    return [
+        u | {"pos": u["pos"] | {"x": float(x) + min(xs), "y": float(y) + min(ys)}}
+        for u, (x, y) in zip(equipments, positions)
+    ]
+
+
+# JSON inputs of a worker process, set once by `_init_worker`
+_inputs:dict[str, list[object]] = {}
+
+
+def _init_worker(inputs:dict[str, list[object]]) -> None:
+    """Initializer of the worker processes, the shared inputs are only sent once per worker."""
+    global _inputs
+    _inputs = inputs
+
+
+def run_scenario(scenario:dict[str,object]) -> list[dict[str,object]]:
+    """Build the topology of a scenario, run its allocation and collect the results.
+
+    Parameters
+    ----------
+    scenario
+        Scenario to run, see `expand_manifest`.
+
+    Returns
+    -------
+    Rows of the output table for the scenario.
+    """
+    pathloss = pathloss_models[scenario["pathloss"].lower()]
+    if scenario["interference"] and scenario["algorithm"] != "greedy":
+        raise ValueError(f"Interferences are only supported by the greedy algorithm, not {scenario['algorithm']}")
+    # The UEs of the file are used as is without seed, and resampled with one
+    equipments = _inputs[scenario["equipments"]]
+    if scenario["seed"] is not None:
+        equipments = resample_equipments(equipments, scenario["seed"])
+
+    start = perf_counter()
+    topo:Topology = build_topology(
+        equipments,
+        _inputs[scenario["towers"]],
+        _inputs[scenario["antennas"]]
+    )
+    if scenario["algorithm"] == "greedy":
+        greedy_allocation(topo, pathloss, scenario["interference"], plot=False)
+    elif scenario["algorithm"] == "optimal":
+        from lib.optimal import optimal_allocation
+        optimal_allocation(topo, pathloss)
+    elif scenario["algorithm"] == "auction":
+        from lib.auction import auction_allocation
+        auction_allocation(topo, pathloss)
+    elif scenario["algorithm"] == "hierarchical":
+        from lib.hierarchical import hierarchical_allocation
+        hierarchical_allocation(topo, pathloss, scenario["cell"])
+    elif scenario["algorithm"] == "sites":
+        from lib.site_selection import site_selection
+        site_selection(topo, pathloss)
+    else:
+        raise ValueError(f"Unknown algorithm {scenario['algorithm']}")
+    duration = perf_counter() - start
+
+    # Collect the metrics of the allocation
+    pylon_users = {p: 0 for p in topo.pylons.keys()}
+    for u in topo.users.values():
+        if u.pylon != None:
+            pylon_users[u.pylon] += 1
+    served_users = sum(pylon_users.values())
+
+    rows = []
+    for p, pylon in topo.pylons.items():
+        antenna = topo.antennas[pylon.antenna_type] if pylon.antenna_type != -1 else None
+        rows.append({
+            **{ c: scenario[c] for c in table_columns[:table_columns.index("users")] },
+            "users": len(topo.users),
+            "served_users": served_users,
+            "duration": duration,
+            "pylon_x": p[0],
+            "pylon_y": p[1],
+            "antenna": "" if antenna is None else antenna.name,
+            "pylon_users": pylon_users[p],
+            "used_bandwidth": 0. if antenna is None else pylon_bandwidth(topo, p) - topo.graph.vertices[p],
+            "total_bandwidth": 0. if antenna is None else pylon_bandwidth(topo, p)
+        })
+    return rows
+
+
+def _run_scenario_safe(scenario:dict[str,object]) -> tuple[dict[str,object], list[dict[str,object]]]:
+    """Run a scenario in a worker process without stopping the whole batch if it fails."""
+    try:
+        return scenario, run_scenario(scenario)
+    except Exception as e:
+        print(f"ERROR in scenario {scenario['scenario']}: {e!r}")
+        return scenario, []
+
+
+def run_batch(manifest:list[dict[str,object]], out_file:str, processes:int|None=None) -> int:
+    """Run all the scenarios of a manifest in a process pool and write a single results table.
+
+    Every JSON input file is only loaded once, by the parent process, and sent once
+    to each worker.
+
+    Parameters
+    ----------
+    manifest
+        JSON loaded manifest, see `expand_manifest`.
+    out_file
+        CSV file to write the results table into.
+    processes
+        Number of worker processes, None to use all the CPUs.
+
+    Returns
+    -------
+    Number of scenarios that ran successfully.
+    """
+    scenarios = expand_manifest(manifest)
+    files = { s[k] for s in scenarios for k in ["equipments", "towers", "antennas"] }
+    inputs = { f: load(open(f, "r")) for f in files }
+    print(f"Running {len(scenarios)} scenarios with {len(files)} input files")
+
+    done = 0
+    with open(out_file, "w", newline="") as f, Pool(processes, initializer=_init_worker, initargs=(inputs,)) as pool:
+        writer = DictWriter(f, fieldnames=table_columns)
+        writer.writeheader()
+        for i,(scenario,rows) in enumerate(pool.imap_unordered(_run_scenario_safe, scenarios)):
+            writer.writerows(rows)
+            f.flush()
+            done += rows != []
+            print(f"Scenario {scenario['scenario']} done ({i+1}/{len(scenarios)})")
+    return done
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--manifest", "Sets the JSON scenarios manifest file to read", str),
+            ("--processes", "Sets the number of worker processes (default: all CPUs)", int),
+            ("--out", "Sets the CSV results table to write (default: output/batch.csv)", str)
+        ],
+        argv,
+        "== Python tool to run many allocation scenarios in parallel =="
+    )
+
+    if "--manifest" not in args:
+        print("Missing --manifest argument\nUse --help for more information about the usage of this program!")
+        exit(0)
+    assert isfile(args["--manifest"])
+
+    reset_output_files([])
+    out_file = args.get("--out", join(output_folder, "batch.csv"))
+    run_batch(load(open(args["--manifest"], "r")), out_file, args.get("--processes"))
+    print(f"Wrote results table to {out_file}")
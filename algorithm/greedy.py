@@ -1,12 +1,11 @@
 from sys import argv
-from numpy import max
-from os.path import isfile
+from os.path import isfile, join
 from json import load
-from lib.topology import Topology, AntennaModel, Pylon, User, pathloss_oh, pathloss_fs, pathloss_simple
-from lib.graph import WeightedGraph
-from lib.util import dist2
+from importlib.util import find_spec
+from lib.topology import build_topology, pathloss_oh, pathloss_models
 from lib.arg_parser import parse_arguments
-from lib.algorithms import greedy_allocation
+from lib.algorithms import greedy_allocation, allocation_summary
+from lib.export import export_allocation, export_formats
 from lib.writer import *
 
 if __name__ == '__main__':
@@ -16,7 +15,21 @@ if __name__ == '__main__':
             ("--equipments", "Sets the JSON equipments file to read", str),
             ("--towers", "Sets the JSON towers file to read", str),
             ("--antennas", "Sets the JSON antenna models file to read", str),
-            ("--pathloss", "Sets the pathloss model to use", str)
+            ("--pathloss", "Sets the pathloss model to use: 'oh' (default), 'fs', 'simple', 'oh-terrain' or 'terrain'", str),
+            ("--terrain", "Sets the JSON terrain file used by the terrain pathloss models", str),
+            ("--interference", "Takes interferences between BSs into account (SINR)", None),
+            ("--dynamic", "Picks the next tower by the density of its still unserved UEs instead of sorting the towers once", None),
+            ("--sectors", "Splits the towers into the sectors of their antenna model (fov), each reusing the full bandwidth of the model", None),
+            ("--lazy-edges", "Generates the edges of a tower only when the algorithm reaches it", None),
+            ("--algorithm", "Sets the allocation algorithm: 'greedy' (default), 'optimal', 'auction', 'hierarchical' or 'sites'", str),
+            ("--candidates", "Limits the optimal algorithm to the N cheapest towers of each UE", int),
+            ("--processes", "Sets the number of processes computing the auction bids", int),
+            ("--max-sites", "Sets the maximum number of towers activated by the sites algorithm", int),
+            ("--cell", "Sets the size (m) of the coarse cells of the hierarchical algorithm (default: 1000)", float),
+            ("--record", "Records the allocation as an animation (.mp4, .gif or a PNG frames folder)", str),
+            ("--record-every", "Sets the number of placed towers between two recorded frames (default: 1)", int),
+            ("--aggregate", "Merges the UEs closer than the given distance (m) into weighted super-UEs for the allocation", float),
+            ("--export", "Sets the format of the allocation tables: 'npz' (default), 'csv' or 'parquet'", str)
         ],
         argv,
         "== Python tool to visualize and build a network infracture =="
@@ -28,7 +41,7 @@ if __name__ == '__main__':
         exit(0)
     assert isfile(args["--equipments"])
     if "--verbose" in args:
-        print(f"Loading topology from {args['--topology']}...")
+        print(f"Loading user equipments from {args['--equipments']}...")
 
     if "--antennas" not in args:
         print("Missing --antennas argument\nUse --help for more information about the usage of this program!")
@@ -44,76 +57,105 @@ if __name__ == '__main__':
     if "--verbose" in args:
         print(f"Loading towers from {args['--towers']}...")
 
-    reset_output_files(["allocation.txt"])
+    # The other engines only use the SNR of omnidirectional towers
+    algorithm = args.get("--algorithm", "greedy").lower()
+    for arg in ("--interference", "--sectors"):
+        if arg in args and algorithm != "greedy":
+            print(f"{arg} is only supported by the greedy algorithm!")
+            exit(0)
+
+    export_format = args.get("--export", "npz").lower()
+    if export_format not in export_formats:
+        print(f"Invalid export format, choose between {', '.join(map(repr, export_formats))}!")
+        exit(0)
+    if export_format == "parquet" and find_spec("pyarrow") is None:
+        print("The Parquet export needs pyarrow, install it with: pip install pyarrow")
+        exit(0)
+    reset_output_files(["allocation.txt", f"allocation_users.{export_format}", f"allocation_pylons.{export_format}"])
 
     # Handle the pathloss arg
     pathloss = None
     if "--pathloss" in args:
-        if args["--pathloss"].lower() == "oh":
-            pathloss = pathloss_oh
-        elif args["--pathloss"].lower() == "fs":
-            pathloss = pathloss_fs
-        elif args["--pathloss"].lower() == "simple":
-            pathloss = pathloss_simple
+        if args["--pathloss"].lower() in pathloss_models:
+            pathloss = pathloss_models[args["--pathloss"].lower()]
         else:
-            print("Invalid pathloss model, choose between 'oh', 'fs' or 'simple'!")
+            print(f"Invalid pathloss model, choose between {', '.join(map(repr, pathloss_models.keys()))}!")
             exit(0)
     else:
         pathloss = pathloss_oh
 
     assert pathloss != None
     if "--verbose" in args:
-        print(f"Using the {args['--pathloss']} pathloss model...")
-
-    # Build the topology
-    topo = Topology()
+        print(f"Using the {args.get('--pathloss', 'oh')} pathloss model...")
 
-    topo.antennas = [
-        AntennaModel(
-            a["name"],
-            a["power"],
-            a["gain"],
-            a["bandwidth"],
-            a["frequency"],
-            a["range"]
-        )
-        for a in load(open(args["--antennas"], "r"))
-    ]
-    topo.pylons = {
-        (t["pos"]["x"], t["pos"]["y"]): Pylon(
-            (t["pos"]["x"], t["pos"]["y"]),
-            t["pos"]["h"],
-            -1 # Antenna type has not been set yet
-        )
-        for t in load(open(args["--towers"], "r"))
-    }
-    topo.users = {
-        (u["pos"]["x"], u["pos"]["y"]): User(
-            (u["pos"]["x"], u["pos"]["y"]),
-            None,# Unassociated user
-            u["demand"]
-        )
-        for u in load(open(args["--equipments"], "r"))
-    }
+    # A file of super-UEs listing their users is allocated as is and split back to the users
+    equipments = load(open(args["--equipments"], "r"))
+    groups = None
+    if any("users" in ue for ue in equipments):
+        from lib.aggregation import split_equipments
+        equipments, groups = split_equipments(equipments)
 
-    # Build the network graph
-    topo.graph = WeightedGraph()
-
-    ## Add UEs to the graph
-    for u in topo.users.keys():
-        topo.graph.add_vertex(u, 0.)
+    # Build the topology and its network graph
+    topo = build_topology(
+        equipments,
+        load(open(args["--towers"], "r")),
+        load(open(args["--antennas"], "r")),
+        "--lazy-edges" in args or "--aggregate" in args or groups is not None# The edges of the individual UEs are not used when aggregating
+    )
+    if "--terrain" in args:
+        from lib.terrain import Terrain
+        assert isfile(args["--terrain"])
+        topo.terrain = Terrain.load(args["--terrain"])
+        if "--verbose" in args:
+            print(f"Using the {topo.terrain.heights.shape[1]}x{topo.terrain.heights.shape[0]} terrain raster from {args['--terrain']}...")
 
-    ## Add the edges to the graph and towers
-    max_reach:float = max(list(map(lambda a: a.reach, topo.antennas)))
+    recorder = None
+    if "--record" in args:
+        from visualize.animation import AllocationRecorder
+        recorder = AllocationRecorder(topo, args["--record"], every=args.get("--record-every", 1))
 
-    for t in topo.pylons.keys():
-        topo.graph.add_vertex(t, 0.)
-        for u in topo.users.keys():
-            d = dist2(t,u)
-            if d <= max_reach:
-                topo.graph.add_edge(t, u, d)
+    # Run the allocation on super-UEs
+    full_topo = None
+    if "--aggregate" in args:
+        from lib.aggregation import aggregate_users
+        full_topo = topo
+        topo, members = aggregate_users(full_topo, args["--aggregate"], "--lazy-edges" in args)
+        if "--verbose" in args:
+            print(f"Aggregated {len(full_topo.users)} UEs into {len(topo.users)} super-UEs")
+    elif groups is not None:
+        from lib.aggregation import group_users
+        full_topo = topo
+        topo, members = group_users(full_topo, groups, "--lazy-edges" in args)
+        if "--verbose" in args:
+            print(f"Loaded {len(full_topo.users)} UEs in {len(topo.users)} super-UEs")
 
-    # Run the greedy algorithm
-    alloc = greedy_allocation(topo, pathloss)
+    # Run the allocation algorithm
+    if algorithm == "greedy":
+        alloc = greedy_allocation(topo, pathloss, "--interference" in args, plot=recorder is None, recorder=recorder if full_topo is None else None, verbose="--verbose" in args, sectors="--sectors" in args, dynamic="--dynamic" in args)
+    elif algorithm == "optimal":
+        from lib.optimal import optimal_allocation
+        alloc = optimal_allocation(topo, pathloss, candidates=args.get("--candidates"))
+    elif algorithm == "auction":
+        from lib.auction import auction_allocation
+        alloc = auction_allocation(topo, pathloss, processes=args.get("--processes", 1))
+    elif algorithm == "hierarchical":
+        from lib.hierarchical import hierarchical_allocation
+        alloc = hierarchical_allocation(topo, pathloss, args.get("--cell", 1000.), verbose="--verbose" in args)
+    elif algorithm == "sites":
+        from lib.site_selection import site_selection
+        alloc = site_selection(topo, pathloss, max_sites=args.get("--max-sites"), verbose="--verbose" in args)
+    else:
+        print("Invalid algorithm, choose between 'greedy', 'optimal', 'auction', 'hierarchical' or 'sites'!")
+        exit(0)
+    if full_topo is not None:
+        from lib.aggregation import disaggregate_allocation
+        disaggregate_allocation(full_topo, topo, members)
+        topo = full_topo
+        alloc = allocation_summary(topo)
+    if recorder is not None:
+        if algorithm != "greedy" or full_topo is not None:
+            recorder.add_allocation(topo)
+        recorder.close()
     write_output(f"Placed antenna: type, remaining bandwidth/total available bandwidth\n", "allocation.txt")
     write_output(f"{alloc}\n", "allocation.txt")
+    export_allocation(topo, join(output_folder, f"allocation_users.{export_format}"), join(output_folder, f"allocation_pylons.{export_format}"))
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import socket
+from copy import copy
+from sys import argv
+from os import remove
+from os.path import isfile, exists
+from lib.topology import Topology, Pylon, User, build_topology, link_budget, Wsolve, pathloss_models, pylon_bandwidth
+from lib.arg_parser import parse_arguments
+from lib.algorithms import greedy_allocation
+
+
+class ReadWriteLock:
+    """Asyncio lock allowing many concurrent readers or a single writer.
+
+    Writers are preferred: once a writer waits, new readers wait too, so a steady
+    flow of read requests can't starve the requests modifying the topology.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire_read(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writing and self._waiting_writers == 0)
+            self._readers += 1
+
+    async def release_read(self) -> None:
+        async with self._condition:
+            self._readers -= 1
+            self._condition.notify_all()
+
+    async def acquire_write(self) -> None:
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writing and self._readers == 0)
+            finally:
+                self._waiting_writers -= 1
+                # Readers held back by a cancelled writer can go on
+                self._condition.notify_all()
+            self._writing = True
+
+    async def release_write(self) -> None:
+        async with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
+class AllocationService:
+    """Local allocation service keeping a topology, its graph and its edges loaded.
+
+    Requests and responses are JSON objects, one per line, exchanged over a Unix
+    socket: `{"id": 1, "method": "allocate", "params": {"pathloss": "oh"}}` is
+    answered with `{"id": 1, "result": ...}` or `{"id": 1, "error": "..."}`.
+    Read-only requests are handled concurrently, requests modifying the topology
+    are handled one at a time. The computations run in a thread pool to keep
+    the event loop responsive.
+    """
+
+    topo:Topology
+    """Warm topology shared by all the requests."""
+    lock:ReadWriteLock
+    """Lock protecting the topology."""
+
+    def __init__(self, topo:Topology):
+        """Constructor of the AllocationService class.
+
+        Parameters
+        ----------
+        topo
+            Topology to serve, with its edges already built.
+        """
+        self.topo = topo
+        self.lock = ReadWriteLock()
+        self.methods = {
+            "allocate": (self.allocate, True),
+            "required_bandwidth": (self.required_bandwidth, False),
+            "add_users": (self.add_users, True),
+            "status": (self.status, False)
+        }
+
+    def allocate(self, pathloss:str="oh", algorithm:str="greedy", interference:bool=False, cell:float=1000.) -> dict[str,object]:
+        """Run an allocation from scratch on the topology.
+
+        Returns
+        -------
+        Number of served users and per pylon antenna, served users and bandwidths.
+        """
+        if interference and algorithm != "greedy":
+            raise ValueError(f"Interferences are only supported by the greedy algorithm, not {algorithm}")
+        self.topo.reset_allocation()
+        if algorithm == "greedy":
+            greedy_allocation(self.topo, pathloss_models[pathloss], interference, plot=False)
+        elif algorithm == "optimal":
+            from lib.optimal import optimal_allocation
+            optimal_allocation(self.topo, pathloss_models[pathloss])
+        elif algorithm == "auction":
+            from lib.auction import auction_allocation
+            auction_allocation(self.topo, pathloss_models[pathloss])
+        elif algorithm == "hierarchical":
+            from lib.hierarchical import hierarchical_allocation
+            hierarchical_allocation(self.topo, pathloss_models[pathloss], cell)
+        else:
+            raise ValueError(f"Unknown algorithm {algorithm}")
+        return self.status()
+
+    def required_bandwidth(self, u:list[float], p:list[float], model:int=0, pathloss:str="oh", demand:float|None=None) -> float|None:
+        """Bandwidth a pylon using a given antenna model has to allocate to a UE.
+
+        The topology is not modified, so that these requests can run concurrently.
+
+        Returns
+        -------
+        Bandwidth in Hz, None if the demand can't be met.
+        """
+        u, p = tuple(u), tuple(p)
+        if demand is None:
+            demand = self.topo.users[u].demand
+        # Shallow view of the topology where the pylon uses the requested model
+        view = copy(self.topo)
+        view.pylons = {p: Pylon(p, self.topo.pylons[p].height, model)}
+        W = float(Wsolve(demand, -174, link_budget(view, p, u, pathloss_models[pathloss])))
+        return W if W <= self.topo.antennas[model].bandwidth else None
+
+    def add_users(self, users:list[dict[str,object]]) -> dict[str,object]:
+        """Add unassociated users (same format as the equipments JSON files) and rebuild the edges."""
+        for ue in users:
+            pos = (ue["pos"]["x"], ue["pos"]["y"])
+            self.topo.users[pos] = User(pos, None, ue["demand"])
+            self.topo.graph.add_vertex(pos, 0.)
+        self.topo.build_edges()
+        return self.status()
+
+    def status(self) -> dict[str,object]:
+        """Current state of the topology and of its allocation."""
+        pylon_users = {p: 0 for p in self.topo.pylons.keys()}
+        for user in self.topo.users.values():
+            if user.pylon != None:
+                pylon_users[user.pylon] += 1
+        pylons = []
+        for p, pylon in self.topo.pylons.items():
+            antenna = self.topo.antennas[pylon.antenna_type] if pylon.antenna_type != -1 else None
+            pylons.append({
+                "pos": list(p),
+                "antenna": None if antenna is None else antenna.name,
+                "users": pylon_users[p],
+                "used_bandwidth": 0. if antenna is None else pylon_bandwidth(self.topo, p) - self.topo.graph.vertices[p],
+                "total_bandwidth": 0. if antenna is None else pylon_bandwidth(self.topo, p)
+            })
+        return {"users": len(self.topo.users), "served_users": sum(pylon_users.values()), "pylons": pylons}
+
+    async def handle_request(self, request:dict[str,object]) -> dict[str,object]:
+        """Dispatch a request to its method with the right lock."""
+        response = {"id": request.get("id")}
+        try:
+            method, writes = self.methods[request["method"]]
+        except KeyError:
+            response["error"] = f"Unknown method {request.get('method')}"
+            return response
+
+        await (self.lock.acquire_write() if writes else self.lock.acquire_read())
+        try:
+            loop = asyncio.get_running_loop()
+            response["result"] = await loop.run_in_executor(None, lambda: method(**request.get("params", {})))
+        except Exception as e:
+            response["error"] = repr(e)
+        finally:
+            await (self.lock.release_write() if writes else self.lock.release_read())
+        return response
+
+    async def handle_client(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        """Answer the requests of a client, concurrently, until it disconnects."""
+        tasks = set()
+
+        async def answer(line:bytes) -> None:
+            try:
+                response = await self.handle_request(json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {"id": None, "error": repr(e)}
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+        while line := await reader.readline():
+            task = asyncio.create_task(answer(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+    async def serve(self, socket_path:str) -> None:
+        """Serve requests on a Unix socket forever."""
+        if exists(socket_path):
+            remove(socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, path=socket_path, limit=2**26)
+        print(f"Serving on {socket_path}")
+        async with server:
+            await server.serve_forever()
+
+
+def request(socket_path:str, method:str, **params) -> object:
+    """Send a single request to a running allocation service.
+
+    Parameters
+    ----------
+    socket_path
+        Unix socket of the service.
+    method
+        Method to call.
+    params
+        Parameters of the method.
+
+    Returns
+    -------
+    Result of the request.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall((json.dumps({"id": 0, "method": method, "params": params}) + "\n").encode())
+        s.shutdown(socket.SHUT_WR)
+        response = json.loads(s.makefile("rb").readline())
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--equipments", "Sets the JSON equipments file to read", str),
+            ("--towers", "Sets the JSON towers file to read", str),
+            ("--antennas", "Sets the JSON antenna models file to read", str),
+            ("--socket", "Sets the Unix socket to listen on (default: /tmp/network_allocation.sock)", str)
+        ],
+        argv,
+        "== Python allocation service keeping a topology loaded =="
+    )
+
+    for arg in ["--equipments", "--towers", "--antennas"]:
+        if arg not in args:
+            print(f"Missing {arg} argument\nUse --help for more information about the usage of this program!")
+            exit(0)
+        assert isfile(args[arg])
+
+    topo = build_topology(
+        json.load(open(args["--equipments"], "r")),
+        json.load(open(args["--towers"], "r")),
+        json.load(open(args["--antennas"], "r"))
+    )
+    service = AllocationService(topo)
+    try:
+        asyncio.run(service.serve(args.get("--socket", "/tmp/network_allocation.sock")))
+    except KeyboardInterrupt:
+        pass
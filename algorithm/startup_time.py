@@ -0,0 +1,75 @@
+import subprocess
+import sys
+from sys import argv
+from statistics import median
+from time import perf_counter
+from lib.arg_parser import parse_arguments
+
+
+default_modules = ["lib.topology", "lib.algorithms", "lib.gps", "algorithm.greedy", "algorithm.batch", "algorithm.service"]
+"""Modules timed when none is given."""
+
+
+def import_time(module:str, runs:int=5) -> float:
+    """Median wall time of importing a module in a fresh interpreter.
+
+    Parameters
+    ----------
+    module
+        Module to import.
+    runs
+        Number of interpreters started.
+
+    Returns
+    -------
+    Median time in seconds, including the interpreter startup.
+    """
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+def import_offenders(module:str, top:int=10) -> list[tuple[float, str]]:
+    """Slowest imports triggered by a module, using `python -X importtime`.
+
+    Parameters
+    ----------
+    module
+        Module to import.
+    top
+        Number of imports to return.
+
+    Returns
+    -------
+    (cumulative time in seconds, imported module) sorted by decreasing time.
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], check=True, capture_output=True, text=True).stderr
+    offenders = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        offenders.append((int(cumulative) * 1e-6, name.strip()))
+    return sorted(offenders, reverse=True)[:top]
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--verbose", "Displays the slowest imports of each module", None),
+            ("--modules", "Sets the comma separated modules to time (default: the main library and scripts modules)", str),
+            ("--runs", "Sets the number of fresh interpreters started per module (default: 5)", int)
+        ],
+        argv,
+        "== Python tool to measure the import time of the project modules =="
+    )
+
+    modules = args["--modules"].split(",") if "--modules" in args else default_modules
+    baseline = import_time("sys", args.get("--runs", 5))
+    print(f"Interpreter startup: {baseline:.3f}s")
+    for module in modules:
+        print(f"{module}: {import_time(module, args.get('--runs', 5)) - baseline:.3f}s")
+        if "--verbose" in args:
+            for t, name in import_offenders(module):
+                print(f"    {t:.3f}s {name}")
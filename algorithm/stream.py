@@ -0,0 +1,110 @@
+import asyncio
+import json
+from sys import argv, stdin, stdout, stderr
+from os import remove
+from os.path import isfile, exists
+from time import perf_counter
+import numpy as np
+from lib.topology import build_topology, pathloss_models
+from lib.arg_parser import parse_arguments
+from lib.stream import StreamingAllocator
+from lib.writer import write_log
+
+
+class LatencyRecorder:
+    """Processing time of the stream messages."""
+
+    def __init__(self):
+        self.latencies = []
+        self.start = perf_counter()
+
+    def handle(self, allocator:StreamingAllocator, line:str|bytes) -> list[dict[str,object]]:
+        """Apply a JSON line to the allocator and record its processing time."""
+        start = perf_counter()
+        try:
+            events = allocator.handle(json.loads(line))
+        except Exception as e:
+            events = [{"error": repr(e)}]
+        self.latencies.append(perf_counter() - start)
+        return events
+
+    def summary(self, allocator:StreamingAllocator) -> str:
+        latencies = np.array(self.latencies) * 1e3
+        if len(latencies) == 0:
+            return "No update processed"
+        return (
+            f"{len(latencies)} updates in {perf_counter() - self.start:.2f}s ({len(latencies) / latencies.sum() * 1e3:.0f} updates/s of processing), "
+            f"latency p50 {np.percentile(latencies, 50):.3f}ms, p99 {np.percentile(latencies, 99):.3f}ms, max {latencies.max():.3f}ms, "
+            f"{allocator.served()}/{len(allocator.users)} UEs served, {allocator.handovers} handovers"
+        )
+
+
+async def serve(allocator:StreamingAllocator, recorder:LatencyRecorder, socket_path:str) -> None:
+    """Apply the messages of the clients of a Unix socket, answering the events of each one on its line."""
+
+    async def handle_client(reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        # The messages are applied one at a time, in their arrival order
+        while line := await reader.readline():
+            writer.write((json.dumps(recorder.handle(allocator, line)) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+    if exists(socket_path):
+        remove(socket_path)
+    server = await asyncio.start_unix_server(handle_client, path=socket_path)
+    print(f"Streaming on {socket_path}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--equipments", "Sets the JSON equipments file of the UEs present at start (default: none)", str),
+            ("--towers", "Sets the JSON towers file to read", str),
+            ("--antennas", "Sets the JSON antenna models file to read", str),
+            ("--pathloss", "Sets the pathloss model to use (default: oh)", str),
+            ("--model", "Sets the antenna model id used by every tower (default: 0)", int),
+            ("--socket", "Reads the updates from the clients of this Unix socket instead of stdin", str),
+            ("--quiet", "Does not write the events, only the final statistics", None)
+        ],
+        argv,
+        "== Python tool to assign a stream of UE updates (JSON lines) to the towers =="
+    )
+
+    for arg in ("--towers", "--antennas"):
+        if arg not in args:
+            print(f"Missing {arg} argument\nUse --help for more information about the usage of this program!")
+            exit(0)
+        assert isfile(args[arg])
+    pathloss_name = args.get("--pathloss", "oh").lower()
+    if pathloss_name not in pathloss_models:
+        print(f"Invalid pathloss model, choose between {', '.join(map(repr, pathloss_models.keys()))}!")
+        exit(0)
+
+    equipments = json.load(open(args["--equipments"], "r")) if "--equipments" in args else []
+    topo = build_topology([], json.load(open(args["--towers"], "r")), json.load(open(args["--antennas"], "r")))
+    allocator = StreamingAllocator(topo, pathloss_models[pathloss_name], args.get("--model", 0))
+    # The initial UEs are the first updates, with their index as id
+    for i, ue in enumerate(equipments):
+        allocator.update(i, (ue["pos"]["x"], ue["pos"]["y"]), ue["demand"])
+    print(f"{allocator.served()}/{len(equipments)} initial UEs served", file=stderr)
+
+    recorder = LatencyRecorder()
+    if "--socket" in args:
+        try:
+            asyncio.run(serve(allocator, recorder, args["--socket"]))
+        except KeyboardInterrupt:
+            pass
+    else:
+        for line in stdin:
+            if not line.strip():
+                continue
+            events = recorder.handle(allocator, line)
+            if "--quiet" not in args:
+                for event in events:
+                    stdout.write(json.dumps(event) + "\n")
+                stdout.flush()
+    summary = recorder.summary(allocator)
+    print(summary, file=stderr)
+    write_log(f"Stream: {summary}")
@@ -0,0 +1,63 @@
+from sys import argv
+from os import makedirs
+from os.path import isfile, join, splitext
+from json import load
+from time import perf_counter
+from resource import getrusage, RUSAGE_SELF
+import numpy as np
+from lib.topology import pathloss_models
+from lib.arg_parser import parse_arguments
+from lib.tiled import json_to_array, ue_columns, tower_columns, tiled_allocation
+from lib.writer import output_folder
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--verbose", "Sets the verbosity of the program", None),
+            ("--equipments", "Sets the UEs file to read, a .npy (UEs, 3) x, y, demand array or a JSON equipments file", str),
+            ("--towers", "Sets the towers file to read, a .npy (towers, 3) x, y, h array or a JSON towers file", str),
+            ("--antennas", "Sets the JSON antenna models file to read", str),
+            ("--pathloss", "Sets the pathloss model to use (default: oh)", str),
+            ("--model", "Sets the antenna model id used by every tower (default: 0)", int),
+            ("--tile", "Sets the size of the tiles in meters (default: 10000)", float),
+            ("--memory", "Sets the memory ceiling of the resident arrays in MB (default: 1024)", float),
+            ("--out", "Sets the folder of the on-disk arrays and results (default: output/tiled)", str)
+        ],
+        argv,
+        "== Python tool to run the allocation of a large region tile by tile from on-disk arrays =="
+    )
+
+    for arg in ("--equipments", "--towers", "--antennas"):
+        if arg not in args:
+            print(f"Missing {arg} argument\nUse --help for more information about the usage of this program!")
+            exit(0)
+        assert isfile(args[arg])
+    pathloss_name = args.get("--pathloss", "oh").lower()
+    if pathloss_name not in pathloss_models:
+        print(f"Invalid pathloss model, choose between {', '.join(map(repr, pathloss_models.keys()))}!")
+        exit(0)
+
+    out_folder = args.get("--out", join(output_folder, "tiled"))
+    makedirs(out_folder, exist_ok=True)
+    # JSON inputs are converted once to on-disk arrays
+    arrays = []
+    for arg, columns, name in (("--equipments", ue_columns, "users.npy"), ("--towers", tower_columns, "towers.npy")):
+        if splitext(args[arg])[1] == ".npy":
+            arrays.append(np.load(args[arg], mmap_mode="r"))
+        else:
+            arrays.append(json_to_array(load(open(args[arg], "r")), columns, join(out_folder, name)))
+
+    start = perf_counter()
+    try:
+        summary = tiled_allocation(
+            arrays[0], arrays[1], load(open(args["--antennas"], "r")), pathloss_models[pathloss_name], out_folder,
+            model=args.get("--model", 0), tile=args.get("--tile", 10e3), memory=args.get("--memory", 1024.) * 1e6,
+            verbose="--verbose" in args
+        )
+    except MemoryError as e:
+        print(f"ERROR: {e}")
+        exit(1)
+    print(f"Served {summary['served_users']}/{summary['users']} UEs with {summary['used_towers']}/{summary['towers']} towers over {summary['tiles']} tiles in {perf_counter() - start:.2f}s")
+    print(f"Largest tile halo: {summary['largest_halo']} UEs, peak memory of the process: {getrusage(RUSAGE_SELF).ru_maxrss / 1e3:.0f} MB")
+    print(f"Results: {', '.join(summary['results'])}")
@@ -0,0 +1,69 @@
+from sys import argv
+from os.path import isfile, join
+from json import load
+from csv import DictWriter
+from time import perf_counter
+import numpy as np
+from lib.topology import build_topology, pathloss_models
+from lib.arg_parser import parse_arguments
+from lib.algorithms import allocation_summary
+from lib.timeseries import demand_matrix, timeseries_allocation, apply_time_step
+from lib.writer import reset_output_files, output_folder
+
+
+if __name__ == '__main__':
+    args = parse_arguments(
+        [
+            ("--verbose", "Sets the verbosity of the program", None),
+            ("--equipments", "Sets the JSON equipments file to read", str),
+            ("--towers", "Sets the JSON towers file to read", str),
+            ("--antennas", "Sets the JSON antenna models file to read", str),
+            ("--pathloss", "Sets the pathloss model to use (default: oh)", str),
+            ("--demand", "Sets the .npy (UEs, time steps) demand matrix to read, in the equipments file order (default: hourly profile of a day)", str),
+            ("--jitter", "Sets the lognormal noise of the default demand profile (default: 0)", float),
+            ("--seed", "Sets the random seed of the demand noise", int),
+            ("--cold", "Allocates every time step from scratch instead of starting from the previous one", None)
+        ],
+        argv,
+        "== Python tool to run the allocation over the time steps of a demand matrix =="
+    )
+
+    for arg in ("--equipments", "--towers", "--antennas"):
+        if arg not in args:
+            print(f"Missing {arg} argument\nUse --help for more information about the usage of this program!")
+            exit(0)
+        assert isfile(args[arg])
+    pathloss_name = args.get("--pathloss", "oh").lower()
+    if pathloss_name not in pathloss_models:
+        print(f"Invalid pathloss model, choose between {', '.join(map(repr, pathloss_models.keys()))}!")
+        exit(0)
+
+    reset_output_files(["timeseries.csv", "allocation.txt"])
+    topo = build_topology(load(open(args["--equipments"], "r")), load(open(args["--towers"], "r")), load(open(args["--antennas"], "r")))
+    if "--demand" in args:
+        demand = np.load(args["--demand"])
+    else:
+        demand = demand_matrix(topo, jitter=args.get("--jitter", 0.), seed=args.get("--seed"))
+
+    start = perf_counter()
+    assigned, allocated = timeseries_allocation(topo, pathloss_models[pathloss_name], demand, warm_start="--cold" not in args, verbose="--verbose" in args)
+    print(f"Allocated {demand.shape[1]} time steps in {perf_counter() - start:.2f}s")
+
+    # One row per time step
+    with open(join(output_folder, "timeseries.csv"), "w", newline="") as f:
+        writer = DictWriter(f, fieldnames=["step", "served_users", "used_bandwidth", "handovers"])
+        writer.writeheader()
+        for t in range(demand.shape[1]):
+            served = assigned[:,t] >= 0
+            writer.writerow({
+                "step": t,
+                "served_users": int(np.count_nonzero(served)),
+                "used_bandwidth": float(allocated[served, t].sum()),
+                "handovers": 0 if t == 0 else int(np.count_nonzero((assigned[:,t] != assigned[:,t-1]) & (assigned[:,t-1] >= 0)))
+            })
+
+    # Allocation of the busiest time step
+    peak = int(np.argmax(demand.sum(axis=0)))
+    print(f"Allocation at the peak time step {peak}:")
+    apply_time_step(topo, assigned, allocated, peak)
+    allocation_summary(topo)
@@ -0,0 +1,199 @@
+import numpy as np
+from lib.topology import Topology, Pylon, User
+from lib.graph import WeightedGraph
+
+
+def group_centroids(pos:np.ndarray, demand:np.ndarray, group:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Demand weighted centroid and total demand of groups of users.
+
+    Parameters
+    ----------
+    pos
+        (N,2) positions of the users.
+    demand
+        Demand of each user.
+    group
+        Group index of each user, from 0 to K-1.
+
+    Returns
+    -------
+    (K,2) centroid and total demand of each group.
+    """
+    k = group.max() + 1 if len(group) else 0
+    total = np.bincount(group, weights=demand, minlength=k)
+    # Plain centroid for the groups without any demand
+    weights = np.where(total[group] > 0, demand, 1.)
+    norm = np.bincount(group, weights=weights, minlength=k)
+    centroids = np.column_stack((
+        np.bincount(group, weights=weights*pos[:,0], minlength=k) / norm,
+        np.bincount(group, weights=weights*pos[:,1], minlength=k) / norm
+    ))
+    return centroids, total
+
+
+def cluster_users(pos:np.ndarray, demand:np.ndarray, radius:float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group users on a square grid of `radius` sized cells.
+
+    Parameters
+    ----------
+    pos
+        (N,2) positions of the users.
+    demand
+        Demand of each user.
+    radius
+        Size of a cell in meters, the users of a group are at most `radius * sqrt(2)` apart.
+
+    Returns
+    -------
+    (K,2) demand weighted centroid and total demand of each group, and the group of each user.
+    """
+    cells = np.floor(pos / radius).astype(np.int64)
+    _, group = np.unique(cells, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    centroids, total = group_centroids(pos, demand, group)
+    return centroids, total, group
+
+
+def group_users(topo:Topology, group:np.ndarray, lazy_edges:bool=False) -> tuple[Topology, dict[int, list[tuple[float,float]]]]:
+    """Build a topology where each group of users is merged into a weighted super-UE.
+
+    Each super-UE is placed at the demand weighted centroid of its users, demands
+    their total demand and carries the index of its group in `User.group`. Groups
+    whose centroids fall on the same position are merged into a single super-UE,
+    so that no user is lost.
+
+    Parameters
+    ----------
+    topo
+        Topology with individual users.
+    group
+        Group index of each user, in the `topo.users` order.
+    lazy_edges
+        Generate the edges of a tower only when they are requested.
+
+    Returns
+    -------
+    Aggregated topology, with its own pylons, and the users of each group index.
+    """
+    keys = list(topo.users.keys())
+    if len(group) != len(keys):
+        raise ValueError(f"{len(group)} group indices given for {len(keys)} users")
+    pos = np.array(keys, dtype=float).reshape(-1, 2)
+    demand = np.array([ topo.users[u].demand for u in keys ], dtype=float)
+    group = np.unique(np.asarray(group, dtype=np.intp), return_inverse=True)[1].reshape(-1)
+    centroids, total = group_centroids(pos, demand, group)
+
+    _, first, same = np.unique(centroids, axis=0, return_index=True, return_inverse=True)
+    if len(first) < len(centroids):
+        # Renumber the groups sharing a centroid in the order of their first group
+        rank = np.empty(len(first), dtype=np.intp)
+        rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+        group = rank[same.reshape(-1)][group]
+        centroids, total = group_centroids(pos, demand, group)
+
+    members = {}
+    order = np.argsort(group, kind='stable')
+    bounds = np.searchsorted(group[order], np.arange(len(centroids)+1))
+    for k in range(len(centroids)):
+        members[k] = [ keys[i] for i in order[bounds[k]:bounds[k+1]].tolist() ]
+
+    aggregated = Topology()
+    aggregated.antennas = topo.antennas
+    aggregated.terrain = topo.terrain
+    aggregated.pylons = { p: Pylon(p, pylon.height, -1) for p,pylon in topo.pylons.items() }
+    aggregated.users = { c: User(c, None, d, k) for k,(c,d) in enumerate(zip(map(tuple, centroids.tolist()), total.tolist())) }
+    aggregated.graph = WeightedGraph()
+    for u in aggregated.users.keys():
+        aggregated.graph.add_vertex(u, 0.)
+    for p in aggregated.pylons.keys():
+        aggregated.graph.add_vertex(p, 0.)
+    aggregated.build_edges(lazy_edges)
+    return aggregated, members
+
+
+def aggregate_users(topo:Topology, radius:float, lazy_edges:bool=False) -> tuple[Topology, dict[int, list[tuple[float,float]]]]:
+    """Build a topology where the close users are merged into weighted super-UEs.
+
+    The users are grouped with `cluster_users` and each group becomes a super-UE
+    (see `group_users`). The allocation is computed on the (much smaller)
+    aggregated topology and then split back with `disaggregate_allocation`. A
+    larger radius means fewer super-UEs but larger errors on the link budgets.
+
+    Parameters
+    ----------
+    topo
+        Topology with individual users.
+    radius
+        Size of the square cells grouping the users in meters.
+    lazy_edges
+        Generate the edges of a tower only when they are requested.
+
+    Returns
+    -------
+    Aggregated topology, with its own pylons, and the users of each group index.
+    """
+    keys = list(topo.users.keys())
+    pos = np.array(keys, dtype=float).reshape(-1, 2)
+    demand = np.array([ topo.users[u].demand for u in keys ], dtype=float)
+    _, _, group = cluster_users(pos, demand, radius)
+    return group_users(topo, group, lazy_edges)
+
+
+def split_equipments(equipments:list[object]) -> tuple[list[object], np.ndarray]:
+    """Individual UEs of an equipments file of super-UEs, as written by `loaders/ue_loader.py --aggregate`.
+
+    A super-UE lists the positions of its individuals in a `users` field and its
+    demand is shared equally between them. The equipments without `users` are kept
+    as single UEs.
+
+    Parameters
+    ----------
+    equipments
+        JSON loaded equipments.
+
+    Returns
+    -------
+    Equipments of the individual UEs and the index of the equipment each one comes from.
+    """
+    individuals, group = [], []
+    for k, ue in enumerate(equipments):
+        users = ue.get("users", [[ue["pos"]["x"], ue["pos"]["y"]]])
+        if not isinstance(users, list):
+            raise ValueError(f"The users of the equipment {k} are not listed, the file can't be disaggregated")
+        for x, y in users:
+            individuals.append({"pos": {"x": x, "y": y}, "demand": ue["demand"] / len(users)})
+            group.append(k)
+    return individuals, np.array(group, dtype=np.intp)
+
+
+def disaggregate_allocation(topo:Topology, aggregated:Topology, members:dict[int, list[tuple[float,float]]]) -> None:
+    """Write the allocation of an aggregated topology back to its individual users.
+
+    The users of a super-UE are served by its pylon and share its bandwidth in
+    proportion to their demand, so the bandwidth used by each pylon is unchanged.
+
+    Parameters
+    ----------
+    topo
+        Topology with individual users, its allocation is overwritten.
+    aggregated
+        Allocated topology returned by `group_users` or `aggregate_users`.
+    members
+        Users of each group index returned with it.
+    """
+    for p, pylon in aggregated.pylons.items():
+        topo.pylons[p].antenna_type = pylon.antenna_type
+        topo.pylons[p].sectors = pylon.sectors
+        topo.graph.vertices[p] = aggregated.graph.vertices[p]
+    for s, super_ue in aggregated.users.items():
+        users = members[super_ue.group]
+        total = super_ue.demand
+        for u in users:
+            user = topo.users[u]
+            user.pylon = super_ue.pylon
+            if super_ue.pylon is None:
+                topo.graph.vertices[u] = 0.
+            elif total > 0:
+                topo.graph.vertices[u] = aggregated.graph.vertices[s] * user.demand / total
+            else:
+                topo.graph.vertices[u] = aggregated.graph.vertices[s] / len(users)
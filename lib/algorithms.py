@@ -1,13 +1,15 @@
 import numpy as np
-from scipy.optimize import root_scalar
-from lib.topology import Topology, Wcost, Wcost_prime, Wlimit
-from lib.graph import WeightedGraph, WeightedEdge
+from lib.topology import Topology, Wcost, Wcost_prime, Wlimit, Wsolve, link_budget, pylon_bandwidth
+from lib.kernels import admit_prefix
+from lib.interference import InterferenceMap
 from lib.writer import write_log
-from visualize.allocation import plot_allocated_bandwidth, plot_topology_allocation
-from typing import Callable
+from lib.progress import Progress
+from typing import Callable, TYPE_CHECKING
+if TYPE_CHECKING:
+    from visualize.animation import AllocationRecorder
 
 
-def qos_density_graph(topo:Topology, p:tuple[float,float]) -> float:
+def qos_density_graph(topo:Topology, p:tuple[float,float], model:int|None=None) -> float:
     """Computes the QoS demand density for a given pylon in the topology.
     The formula is arbitrary.
 
@@ -17,26 +19,49 @@ def qos_density_graph(topo:Topology, p:tuple[float,float]) -> float:
         Topology object.
     p
         Pylon to compute the density of.
+    model
+        Only consider the UEs within the reach of this antenna model, None for all the edges.
 
     Returns
     -------
     Density value.
     """
-    sum:float = 0.
-    for e in topo.graph.edges[p]:
-        sum += topo.users[e.v].demand / e.w
-    return sum / len(topo.graph.edges[p])
+    users, dist = topo.edge_store.edges(p, model)
+    if len(users) == 0:
+        return 0.
+    keys = topo.edge_store.users.keys
+    demand = np.array([ topo.users[keys[j]].demand for j in users ])
+    return np.mean(demand / dist)
+
 
+def compute_W_allocation(topo:Topology, u:tuple[float,float], p:tuple[float,float], pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], interference:InterferenceMap|None=None) -> float:
+    """Compute the bandwidth a pylon has to allocate to a UE to meet its demand.
 
-def compute_W_allocation(topo:Topology, u:tuple[float,float], p:tuple[float,float], pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> float:
-    """TODO
+    Parameters
+    ----------
+    topo
+        Topology object.
+    u
+        Position of the UE.
+    p
+        Position of the pylon.
+    pathloss
+        Path loss model to use.
+    interference
+        Interference map to use the SINR instead of the SNR, None to ignore interferences.
+
+    Returns
+    -------
+    Bandwidth to allocate in Hz, or a value bigger than the antenna bandwidth if the demand can't be met.
     """
+    from scipy.optimize import root_scalar # Imported on first use to keep the library import fast
+
     a = 1
     C = a*topo.users[u].demand
     PL = pathloss(topo, p, u)
-    N0 = -174
+    N0 = -174 if interference is None else interference.noise_density(u, p)
     antenna = topo.antennas[topo.pylons[p].antenna_type]
-    S = antenna.power + antenna.gain - PL
+    S = link_budget(topo, p, u, pathloss)
 
     # Compute the limit at infinity
     lim = Wlimit(C, N0, S)
@@ -47,7 +72,6 @@ def compute_W_allocation(topo:Topology, u:tuple[float,float], p:tuple[float,floa
         opt_res = root_scalar(Wcost, fprime=Wcost_prime, x0=0.5*C, args=(C, N0, S), bracket=[1, 1e22])
 
         if opt_res.converged:
-            print(f"Allocating {opt_res.root:.2f} Hz of bandwidth to {u}")
             write_log(f"Allocating {opt_res.root:.2f} Hz of bandwidth to {u}")
             return opt_res.root
         else:
@@ -59,36 +83,134 @@ def compute_W_allocation(topo:Topology, u:tuple[float,float], p:tuple[float,floa
     return antenna.bandwidth + 1# Return a value that will be considered as too big to allocate
 
 
-def get_closest_unallocated_ue(g:WeightedGraph, p:tuple[float,float]) -> WeightedEdge:
-    """Get the closest unallocated user equipment from a given pylon.
+def compute_W_edges(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], model:int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute at once the bandwidth to allocate on every edge within the reach of an antenna model.
+
+    Every pylon of the topology is set to use the given antenna model.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    pathloss
+        Path loss model to use.
+    model
+        Antenna model id to use for all the pylons.
+
+    Returns
+    -------
+    Pylon indices (in `topo.edge_store.pylons`), UE indices (in `topo.edge_store.users`)
+    and bandwidth to allocate in Hz of each edge, `np.inf` if the demand can't be met.
+    """
+    if topo.edge_store is None:
+        topo.build_edges()
+    store = topo.edge_store
+    demand = np.array([ topo.users[u].demand for u in store.users.keys ], dtype=float)
+
+    p_idx, u_idx, W = [], [], []
+    for i,p in enumerate(store.pylons):
+        topo.pylons[p].antenna_type = model
+        users, _ = store.edges(p, model)
+        pos = store.users.pos[users]
+        S = link_budget(topo, p, (pos[:,0], pos[:,1]), pathloss)
+        p_idx.append(np.full(len(users), i, dtype=np.intp))
+        u_idx.append(users)
+        W.append(Wsolve(demand[users], -174, S))
+
+    if p_idx == []:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+    return np.concatenate(p_idx), np.concatenate(u_idx), np.concatenate(W)
+
+
+def get_closest_unallocated_ue(topo:Topology, users:np.ndarray, start:int) -> int:
+    """Get the closest unallocated user equipment from a pylon's sorted edges.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    users
+        UE indices of the pylon's edges sorted by distance.
+    start
+        Position in `users` to start the search from.
+
+    Returns
+    -------
+    Position in `users` of the closest unallocated user equipment, `len(users)` if there is none.
+    """
+    keys = topo.edge_store.users.keys
+    # Skip already served user equipments by checking if the vertex already has allocated bandwidth
+    while start < len(users) and topo.graph.vertices[keys[users[start]]] != 0.:
+        start += 1
+    return start
+
+
+def greedy_fill_edges(topo:Topology, p:tuple[float,float], users:np.ndarray, Wmax:float, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], interference:InterferenceMap|None=None, plot:bool=True) -> float:
+    """Allocate a bandwidth pool greedily to the unallocated UEs of some edges, starting with the closest one.
+
+    The bandwidths of the edges are solved with `Wsolve` and admitted with `admit_prefix`,
+    by chunks growing until the pool is full, so the closest UEs are handled without a
+    Python loop per UE. The pool stops at the first UE it can't serve, like
+    `compute_W_allocation` followed one UE at a time.
 
     Parameters
     ----------
-    g
-        Graph object.
+    topo
+        Topology object.
     p
-        Pylon to consider.
+        Pylon id that will allocate its bandwidth, its antenna model must be set.
+    users
+        UE indices of the edges sorted by distance.
+    Wmax
+        Bandwidth of the pool in Hz.
+    pathloss
+        Path loss model to use.
+    interference
+        Interference map to use, None to ignore interferences.
+    plot
+        Plot the bandwidth found for the closest UE.
 
     Returns
     -------
-    Closest unallocated user equipment.
+    The unallocated bandwidth of the pool
     """
-    # Check if we still have edges to handle
-    if g.edges[p] == []:
-        return None
+    store = topo.edge_store
+    keys = store.users.keys
+
     # Skip already served user equipments by checking if the vertex already has allocated bandwidth
-    e = g.edges[p][0]
-    while g.vertices[e.v] != 0.:
-        g.edges[p].pop(0)
-        # Check if we still have edges to handle
-        if g.edges[p] == []:
-            return None
-        e = g.edges[p][0]
-    # Return the non empty edge
-    return e
-
-
-def greedy_eu_bandwidth_allocation(topo:Topology, p:tuple[float,float], model:int, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> float:
+    users = users[np.array([ topo.graph.vertices[keys[j]] == 0. for j in users.tolist() ], dtype=bool)]
+    if len(users) == 0:
+        return Wmax
+
+    if plot:
+        # The plotting dependencies are only imported when plotting
+        from visualize.allocation import plot_allocated_bandwidth
+        plot_allocated_bandwidth(topo, p, keys[users[0]], pathloss)
+
+    # The pool only serves while it has strictly more bandwidth than the next UE needs
+    start, size = 0, 64
+    while start < len(users):
+        chunk = users[start:start+size]
+        pos = store.users.pos[chunk]
+        C = np.array([ topo.users[keys[j]].demand for j in chunk.tolist() ])
+        N0 = -174 if interference is None else np.array([ interference.noise_density(keys[j], p) for j in chunk.tolist() ])
+        W = Wsolve(C, N0, link_budget(topo, p, (pos[:,0], pos[:,1]), pathloss))
+        n = admit_prefix(W, np.nextafter(Wmax, 0.))
+        for j, w in zip(chunk[:n].tolist(), W[:n].tolist()):
+            # Keep the allocation information in the user and its vertex
+            topo.users[keys[j]].pylon = p
+            topo.graph.vertices[keys[j]] = w
+        Wmax -= W[:n].sum()
+        write_log(f"Allocated {W[:n].sum():.2f} Hz of bandwidth to {n} UEs, {Wmax:.2f} Hz left")
+        if n < len(chunk):
+            # The remaining edges are left untouched since the BS is already saturated
+            write_log(f"Can't allocate {W[n]:.2f} Hz of bandwidth to {keys[chunk[n]]}")
+            break
+        start, size = start + size, 2 * size
+    return Wmax
+
+
+def greedy_eu_bandwidth_allocation(topo:Topology, p:tuple[float,float], model:int, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], interference:InterferenceMap|None=None, plot:bool=True, sectors:bool=False) -> float:
     """Given an antenna, allocate bandwidth greedily starting with the closest EU.
 
     Parameters
@@ -99,81 +221,169 @@ def greedy_eu_bandwidth_allocation(topo:Topology, p:tuple[float,float], model:in
         Pylon id that will allocate its bandwidth.
     model
         Antenna model id to use for the given pylon.
+    pathloss
+        Path loss model to use.
+    interference
+        Interference map to update and use, None to ignore interferences.
+    plot
+        Plot the bandwidth found for the closest UE.
+    sectors
+        Split the pylon into the sectors of its antenna model, each sector allocating
+        its own bandwidth to the UEs of its angular slice only. Full frequency reuse
+        is assumed: every sector has the whole bandwidth of the model, so a site has
+        `sectors` times the capacity of an omnidirectional one, and the interference
+        between the sectors of a site is not modelled.
 
     Returns
     -------
-    The unallocated bandwidth of the Base Station
+    The unallocated bandwidth of the Base Station, summed over its sectors
     """
     # Set the antenna type and max bandwidth to allocate for the handled pylon
     topo.pylons[p].antenna_type = model
+    topo.pylons[p].sectors = topo.antennas[model].sectors if sectors else 1
     Wmax = topo.antennas[model].bandwidth
+    if interference is not None:
+        interference.update(p)
 
-    e = get_closest_unallocated_ue(topo.graph, p)
-    if e == None:
-        return Wmax
-    Wc = compute_W_allocation(topo, e.v, p, pathloss)
-
-    plot_allocated_bandwidth(topo, p, e.v, pathloss)
-
-    # While we have enough bandwidth to allocate
-    while Wmax > Wc:
-        write_log(f"Allocating {Wc:.2f}/{Wmax:.2f} Hz of bandwidth to {e.v}")
-        Wmax -= Wc
-        # Reverse the edge to keep the allocation information
-        topo.users[e.v].pylon = p
-        topo.graph.vertices[e.v] = Wc
-        topo.graph.edges[p].pop(0)
-        e = get_closest_unallocated_ue(topo.graph, p)
-        if e == None:
-            return Wmax
-        Wc = compute_W_allocation(topo, e.v, p, pathloss)
-    # Remove the remaining edges since the BS is already saturated
-    topo.graph.edges[p] = []
-    write_log(f"Can't allocate {Wc:.2f} Hz of bandwidth to {e.v}")# DEBUG
-    return Wmax
+    # Only the edges within the reach of the chosen model are considered
+    if topo.pylons[p].sectors == 1:
+        users, _ = topo.edge_store.edges(p, model)
+        return greedy_fill_edges(topo, p, users, Wmax, pathloss, interference, plot)
+    remaining = 0.
+    for s in range(topo.pylons[p].sectors):
+        users, _ = topo.edge_store.sector_edges(p, model, s)
+        remaining += greedy_fill_edges(topo, p, users, Wmax, pathloss, interference, plot and s == 0)
+    return remaining
 
 
-def greedy_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> dict[tuple[float,float],str]:
+def greedy_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], interference:bool=False, plot:bool=True, recorder:"AllocationRecorder|None"=None, verbose:bool=False, sectors:bool=False, dynamic:bool=False) -> dict[tuple[float,float],str]:
     """Greedy algorithm to allocate pylons to end users.
 
     Parameters
     ----------
     topo
         Topology object.
+    pathloss
+        Path loss model to use.
+    interference
+        Use the SINR (interferences of the already placed antennas) instead of the SNR.
+    plot
+        Plot the allocation after each pylon.
+    recorder
+        Animation recorder to send the allocation of each pylon to.
+    verbose
+        Print the progress of the allocation.
+    sectors
+        Give each sector of the antenna models (see `AntennaModel.fov`) its own bandwidth pool,
+        with full frequency reuse (see `greedy_eu_bandwidth_allocation`).
+    dynamic
+        Pick the next pylon by the density of its still unserved UEs (see `DensityQueue`)
+        instead of sorting the pylons once by their initial density.
 
     Returns
     -------
     dict
         Pylons allocation.
     """
-    # Compute the qos constraint density for each pylon
-    # Simple formula : mean of all the qos constraints with all the neighbours
-    pylons_density:dict[tuple[float,float], float] = {p: qos_density_graph(topo, p) for p in topo.pylons.keys()}
-    write_log("--- Pylons' qos density ---")
-    write_log(pylons_density)
+    antenna_model = 0 # Default 5G antenna model
 
-    # Sort pylons by qos density
-    sorted_pylons = sorted(pylons_density.items(), key=lambda x: x[1], reverse=True)
-    write_log("--- Pylons sorted by qos density ---")
-    write_log(sorted_pylons)
+    if topo.edge_store is None:
+        topo.build_edges()
 
-    antenna_model = 0 # Default 5G antenna model
+    if dynamic:
+        from lib.priority import DensityQueue
+        queue = DensityQueue(topo, antenna_model)
+        sorted_pylons = iter(queue.pop, None)
+        write_log("--- Pylons ordered dynamically by the qos density of their unserved UEs ---")
+    else:
+        # Compute the qos constraint density for each pylon
+        # Simple formula : mean of all the qos constraints with all the neighbours within the antenna reach
+        pylons_density:dict[tuple[float,float], float] = {p: qos_density_graph(topo, p, antenna_model) for p in topo.pylons.keys()}
+        write_log("--- Pylons' qos density ---")
+        write_log(pylons_density)
+
+        # Sort pylons by qos density
+        sorted_pylons = [ p for p,_ in sorted(pylons_density.items(), key=lambda x: x[1], reverse=True) ]
+        write_log("--- Pylons sorted by qos density ---")
+        write_log(sorted_pylons)
+
+    interference_map = InterferenceMap(topo, pathloss) if interference else None
 
     #left_bandwidth:float = greedy_eu_bandwidth_allocation(topo, sorted_pylons[0][0], antenna_model, True)
     #return {sorted_pylons[0][0]: (topo.antennas[antenna_model].name, left_bandwidth, topo.antennas[antenna_model].bandwidth)}
 
+    keys = topo.edge_store.users.keys
+    progress = Progress("Allocating towers", len(topo.pylons), enabled=verbose)
     for p in sorted_pylons:
         # Allocate and write the remaining bandwidth in the graph
-        topo.graph.vertices[p[0]] = greedy_eu_bandwidth_allocation(topo, p[0], antenna_model, pathloss)
-        plot_topology_allocation(topo)
+        topo.graph.vertices[p] = greedy_eu_bandwidth_allocation(topo, p, antenna_model, pathloss, interference_map, plot, sectors)
+        if plot:
+            from visualize.allocation import plot_topology_allocation
+            plot_topology_allocation(topo)
+        if recorder is not None or dynamic:
+            users, _ = topo.edge_store.edges(p, antenna_model)
+            served = users[np.array([ topo.users[keys[j]].pylon == p for j in users.tolist() ], dtype=bool)]
+            if recorder is not None:
+                recorder.add_pylon(p, [ keys[j] for j in served.tolist() ], [ topo.graph.vertices[keys[j]] for j in served.tolist() ])
+            if dynamic:
+                queue.serve(served)
+        progress.update()
+    progress.close()
+
+    return allocation_summary(topo)
+
+
+def apply_edges_allocation(topo:Topology, model:int, p_idx:np.ndarray, u_idx:np.ndarray, W:np.ndarray) -> None:
+    """Write an allocation given as a set of chosen edges in the topology, like the greedy does.
 
+    Parameters
+    ----------
+    topo
+        Topology object, every pylon uses the given model.
+    model
+        Antenna model id used by every pylon.
+    p_idx
+        Pylon index (in `topo.edge_store.pylons`) of each chosen edge.
+    u_idx
+        UE index (in `topo.edge_store.users`) of each chosen edge.
+    W
+        Bandwidth allocated on each chosen edge in Hz.
+    """
+    store = topo.edge_store
+    for p in store.pylons:
+        topo.graph.vertices[p] = topo.antennas[model].bandwidth
+    for i, j, w in zip(p_idx.tolist(), u_idx.tolist(), W.tolist()):
+        p = store.pylons[i]
+        u = store.users.keys[j]
+        topo.users[u].pylon = p
+        topo.graph.vertices[u] = w
+        topo.graph.vertices[p] -= w
+
+
+def allocation_summary(topo:Topology) -> dict[tuple[float,float],str]:
+    """Print and return the pylons information of an allocated topology.
+
+    The unused pylons (-1 antenna type) are left out.
+
+    Parameters
+    ----------
+    topo
+        Topology object with the remaining bandwidth of each pylon in its graph vertices.
+
+    Returns
+    -------
+    dict
+        Pylons allocation, empty if some users are not served.
+    """
     # Print pylons information
     tmp_pylons_info = {p: 0 for p in topo.pylons.keys()}
     for u in topo.users.values():
         if u.pylon != None:
             tmp_pylons_info[u.pylon] += 1
     for p, pylon in topo.pylons.items():
-        print(f"{p}: Serving {tmp_pylons_info[p]} users, {topo.antennas[pylon.antenna_type].bandwidth-topo.graph.vertices[p]:.2f}/{topo.antennas[pylon.antenna_type].bandwidth:.2f}")
+        if pylon.antenna_type == -1:
+            continue
+        print(f"{p}: Serving {tmp_pylons_info[p]} users, {pylon_bandwidth(topo, p)-topo.graph.vertices[p]:.2f}/{pylon_bandwidth(topo, p):.2f}")
 
     for u in topo.users.values():
         if u.pylon == None:
@@ -181,5 +391,5 @@ def greedy_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,fl
             return {}
 
     return {
-        p: f"{topo.antennas[pylon.antenna_type].name}: Serving {tmp_pylons_info[p]} users, {topo.antennas[pylon.antenna_type].bandwidth-topo.graph.vertices[p]:.2f}/{topo.antennas[pylon.antenna_type].bandwidth:.2f}"
-        for p, pylon in topo.pylons.items() }
+        p: f"{topo.antennas[pylon.antenna_type].name}: Serving {tmp_pylons_info[p]} users, {pylon_bandwidth(topo, p)-topo.graph.vertices[p]:.2f}/{pylon_bandwidth(topo, p):.2f}"
+        for p, pylon in topo.pylons.items() if pylon.antenna_type != -1 }
@@ -0,0 +1,154 @@
+import numpy as np
+from multiprocessing import Pool
+from typing import Callable
+from lib.topology import Topology
+from lib.algorithms import compute_W_edges, apply_edges_allocation, allocation_summary
+from lib.shared import SharedArrays
+from lib.kernels import accept_segments
+from lib.writer import write_log
+
+
+# Edge arrays of a bidding worker process, attached once by `_init_bidder`
+_bidder_edges:SharedArrays|None = None
+
+
+def _init_bidder(descriptor:dict[str, tuple[str, tuple[int,...], str]]) -> None:
+    """Initializer of the bidding processes, the edge arrays are attached from shared memory."""
+    global _bidder_edges
+    _bidder_edges = SharedArrays.attach(descriptor)
+
+
+def compute_bids(W:np.ndarray, p_idx:np.ndarray, u_ptr:np.ndarray, price:np.ndarray, active:np.ndarray, users:tuple[int,int]) -> np.ndarray:
+    """Choose the edge each bidding UE of a range bids on.
+
+    A UE bids on its active edge with the lowest priced bandwidth `W * (1 + price)`.
+
+    Parameters
+    ----------
+    W
+        Bandwidth to allocate on each edge, edges grouped by UE.
+    p_idx
+        Pylon index of each edge.
+    u_ptr
+        Start offset of the edges of each UE (and total number of edges at the end).
+    price
+        Current price of each pylon.
+    active
+        Whether each edge of the UE range can still be bid on.
+    users
+        (first, last+1) range of UEs to compute the bids of.
+
+    Returns
+    -------
+    Indices of the edges bid on, at most one per UE.
+    """
+    start, end = u_ptr[users[0]], u_ptr[users[1]]
+    cost = np.where(active, W[start:end] * (1 + price[p_idx[start:end]]), np.inf)
+    if len(cost) == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    # Minimum cost of each UE having at least one edge
+    starts = u_ptr[users[0]:users[1]] - start
+    ends = u_ptr[users[0]+1:users[1]+1] - start
+    has_edges = ends > starts
+    starts, ends = starts[has_edges], ends[has_edges]
+    best = np.minimum.reduceat(cost, starts)
+
+    # First edge reaching the minimum of each UE, skipping UEs without any active edge
+    segment = np.repeat(np.arange(len(starts)), ends - starts)
+    candidates = np.flatnonzero((cost == best[segment]) & np.isfinite(cost))
+    _, first = np.unique(segment[candidates], return_index=True)
+    return start + candidates[first]
+
+
+def _shard_bids(args:tuple[np.ndarray, np.ndarray, tuple[int,int]]) -> np.ndarray:
+    """Compute the bids of a UE range in a worker process."""
+    price, active, users = args
+    return compute_bids(_bidder_edges["W"], _bidder_edges["p_idx"], _bidder_edges["u_ptr"], price, active, users)
+
+
+def auction_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], model:int=0, price_step:float=1., max_rounds:int=1000, processes:int=1) -> dict[tuple[float,float],str]:
+    """Auction algorithm to allocate pylons to end users.
+
+    At each round, every unserved UE bids on the pylon with the lowest priced
+    bandwidth. Each pylon accepts its cheapest bids while it has enough bandwidth
+    left and the edges it can no longer afford are removed. The price of a pylon
+    rises with its load and with the bandwidth it had to reject, which steers the
+    next bids towards the less loaded pylons. Every bid is either accepted or
+    removed, so the auction ends after at most the maximum number of edges of a UE.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    pathloss
+        Path loss model to use.
+    model
+        Antenna model id used by every pylon.
+    price_step
+        Price increase for a load (or rejected bandwidth) equal to the whole antenna bandwidth.
+    max_rounds
+        Maximum number of bidding rounds.
+    processes
+        Number of processes computing the bids, the UEs are split in as many shards
+        and the edge arrays are shared with the processes without copies.
+
+    Returns
+    -------
+    dict
+        Pylons allocation, with the same format as `greedy_allocation`.
+    """
+    p_idx, u_idx, W = compute_W_edges(topo, pathloss, model)
+    store = topo.edge_store
+    capacity = topo.antennas[model].bandwidth
+    n_users = len(store.users)
+
+    # Keep the affordable edges grouped by UE
+    feasible = W <= capacity
+    p_idx, u_idx, W = p_idx[feasible], u_idx[feasible], W[feasible]
+    order = np.argsort(u_idx, kind='stable')
+    p_idx, u_idx, W = p_idx[order], u_idx[order], W[order]
+    u_ptr = np.zeros(n_users+1, dtype=np.intp)
+    np.cumsum(np.bincount(u_idx, minlength=n_users), out=u_ptr[1:])
+
+    remaining = np.full(len(store.pylons), capacity)
+    rejected = np.zeros(len(store.pylons))
+    price = np.zeros(len(store.pylons))
+    active = np.ones(len(W), dtype=bool)
+    won = np.zeros(len(W), dtype=bool)
+
+    shards = [ (n_users*i // processes, n_users*(i+1) // processes) for i in range(processes) ]
+    shared = SharedArrays.publish({"W": W, "p_idx": p_idx, "u_ptr": u_ptr}) if processes > 1 else None
+    pool = Pool(processes, initializer=_init_bidder, initargs=(shared.descriptor,)) if processes > 1 else None
+    try:
+        for r in range(max_rounds):
+            if pool is None:
+                bids = compute_bids(W, p_idx, u_ptr, price, active, (0, n_users))
+            else:
+                bids = np.concatenate(pool.map(_shard_bids, [ (price, active[u_ptr[a]:u_ptr[b]], (a, b)) for a,b in shards ]))
+            if len(bids) == 0:
+                break
+
+            # Each pylon accepts its cheapest bids while they fit in its remaining bandwidth
+            bids = bids[np.lexsort((W[bids], p_idx[bids]))]
+            bid_pylons = p_idx[bids]
+            accepted = accept_segments(bid_pylons, W[bids], remaining)
+
+            won[bids[accepted]] = True
+            np.subtract.at(remaining, bid_pylons[accepted], W[bids[accepted]])
+            np.add.at(rejected, bid_pylons[~accepted], W[bids[~accepted]])
+
+            # Served UEs stop bidding and unaffordable edges are removed
+            served = np.zeros(n_users, dtype=bool)
+            served[u_idx[bids[accepted]]] = True
+            active &= ~served[u_idx] & (W <= remaining[p_idx])
+            price = price_step * (capacity - remaining + rejected) / capacity
+            write_log(f"Auction round {r}: {len(bids)} bids, {np.count_nonzero(accepted)} accepted")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            shared.close()
+
+    apply_edges_allocation(topo, model, p_idx[won], u_idx[won], W[won])
+    return allocation_summary(topo)
@@ -0,0 +1,231 @@
+import numpy as np
+from typing import Iterable
+from lib.graph import WeightedGraph, WeightedEdge
+from lib.spatial import PointIndex
+from lib.util import azimuth, sector_index
+
+
+class EdgeStore:
+    """Pylons to UEs edges stored as CSR arrays.
+
+    The edges of a pylon are the UEs within the maximum reach of all the antenna
+    models, sorted by increasing distance. The end offset of the edges within the
+    reach of each antenna model is precomputed, so that changing the antenna
+    model of a pylon only selects a prefix of its edges without any rebuild.
+
+    The edges of the sectorized antenna models are also binned per sector on
+    first use, so that a sector only scans the UEs of its own angular slice.
+    """
+
+    users:PointIndex
+    """Spatial index of the UEs, `user_idx` values are its indices."""
+    pylons:list[tuple[float,float]]
+    """Positions of the pylons, in CSR rows order."""
+    pylon_ids:dict[tuple[float,float], int]
+    """Position of a pylon and its CSR row."""
+    reaches:np.ndarray
+    """Reach of each antenna model in meters."""
+    indptr:np.ndarray
+    """Start offset of the edges of each pylon (and total number of edges at the end)."""
+    user_idx:np.ndarray
+    """UE index of each edge."""
+    dist:np.ndarray
+    """Length of each edge in meters."""
+    cutoffs:np.ndarray
+    """(pylons, antenna models) end offset of the edges within the reach of each model."""
+    sectors:list[int]
+    """Number of sectors of each antenna model."""
+
+    def __init__(self, users:Iterable[tuple[float,float]], pylons:Iterable[tuple[float,float]], reaches:list[float], sectors:list[int]|None=None):
+        """Build the edges between pylons and UEs.
+
+        Parameters
+        ----------
+        users
+            Positions of the UEs.
+        pylons
+            Positions of the pylons.
+        reaches
+            Reach of each antenna model in meters.
+        sectors
+            Number of sectors of each antenna model, omnidirectional models if None.
+        """
+        from scipy.spatial import cKDTree # Imported on first use to keep the library import fast
+
+        self.users = PointIndex(users)
+        self.pylons = list(pylons)
+        self.pylon_ids = {p: i for i,p in enumerate(self.pylons)}
+        self.reaches = np.array(reaches, dtype=float)
+        self.sectors = [1] * len(self.reaches) if sectors is None else list(sectors)
+        self._sector_bins = {}
+
+        # Find every (pylon, UE) pair within the maximum reach and sort them by pylon then distance
+        pylons_pos = np.array(self.pylons, dtype=float).reshape(-1, 2)
+        pairs = cKDTree(pylons_pos).sparse_distance_matrix(self.users.tree, np.max(self.reaches), output_type='ndarray')
+        order = np.lexsort((pairs['v'], pairs['i']))
+        self.user_idx = pairs['j'][order].astype(np.intp)
+        self.dist = pairs['v'][order]
+
+        self.indptr = np.zeros(len(self.pylons)+1, dtype=np.intp)
+        np.cumsum(np.bincount(pairs['i'], minlength=len(self.pylons)), out=self.indptr[1:])
+
+        self.cutoffs = np.empty((len(self.pylons), len(self.reaches)), dtype=np.intp)
+        for i in range(len(self.pylons)):
+            start, end = self.indptr[i], self.indptr[i+1]
+            self.cutoffs[i] = start + np.searchsorted(self.dist[start:end], self.reaches, side='right')
+
+    def edges(self, p:tuple[float,float], model:int|None=None) -> tuple[np.ndarray, np.ndarray]:
+        """Edges of a pylon within the reach of an antenna model.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+        model
+            Antenna model index, None to get all the stored edges.
+
+        Returns
+        -------
+        UE indices and distances of the edges sorted by distance (views on the store arrays).
+        """
+        i = self.pylon_ids[p]
+        start = self.indptr[i]
+        end = self.indptr[i+1] if model is None else self.cutoffs[i, model]
+        return self.user_idx[start:end], self.dist[start:end]
+
+    def _bin_sectors(self, model:int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR arrays of the edges within the reach of a model, one row per (pylon, sector)."""
+        n = self.sectors[model]
+        pylon = np.repeat(np.arange(len(self.pylons)), np.diff(self.indptr))
+        within = np.arange(len(self.user_idx)) < self.cutoffs[pylon, model]
+        pylon, user_idx, dist = pylon[within], self.user_idx[within], self.dist[within]
+
+        # Azimuth of every edge at once
+        pylons_pos = np.array(self.pylons, dtype=float).reshape(-1, 2)
+        pos = self.users.pos[user_idx]
+        rows = pylon * n + sector_index(azimuth((pylons_pos[pylon,0], pylons_pos[pylon,1]), pos[:,0], pos[:,1]), n)
+
+        # The edges of a pylon are sorted by distance, a stable sort keeps that order in each sector
+        order = np.argsort(rows, kind='stable')
+        indptr = np.searchsorted(rows[order], np.arange(len(self.pylons) * n + 1))
+        return indptr, user_idx[order], dist[order]
+
+    def sector_edges(self, p:tuple[float,float], model:int, sector:int) -> tuple[np.ndarray, np.ndarray]:
+        """Edges of a pylon within the reach and in a sector of an antenna model.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+        model
+            Antenna model index.
+        sector
+            Sector index, see `lib.util.sector_index`.
+
+        Returns
+        -------
+        UE indices and distances of the edges sorted by distance.
+        """
+        n = self.sectors[model]
+        if n == 1:
+            return self.edges(p, model)
+        if model not in self._sector_bins:
+            self._sector_bins[model] = self._bin_sectors(model)
+        indptr, user_idx, dist = self._sector_bins[model]
+        row = self.pylon_ids[p] * n + sector
+        return user_idx[indptr[row]:indptr[row+1]], dist[indptr[row]:indptr[row+1]]
+
+    def add_to_graph(self, graph:WeightedGraph) -> None:
+        """Add the stored edges to a graph already containing the pylons vertices.
+
+        Parameters
+        ----------
+        graph
+            Graph to add the edges to.
+        """
+        for p in self.pylons:
+            idx, dist = self.edges(p)
+            # The edges are already sorted, no need to insert them one by one
+            graph.edges[p] += [ WeightedEdge(p, self.users.keys[j], d) for j,d in zip(idx, dist.tolist()) ]
+
+
+class LazyEdgeProvider:
+    """Pylons to UEs edges generated on demand, one pylon at a time.
+
+    It exposes the same `edges` interface as `EdgeStore` but only keeps the
+    spatial index of the UEs in memory. The edges of a pylon are found and sorted
+    when requested and freed as soon as the caller drops them, so the peak memory
+    is bounded by the maximum degree of a pylon instead of the total number of edges.
+    """
+
+    users:PointIndex
+    """Spatial index of the UEs, the returned UE indices are its indices."""
+    pylons:list[tuple[float,float]]
+    """Positions of the pylons."""
+    pylon_ids:dict[tuple[float,float], int]
+    """Position of a pylon and its index in `pylons`."""
+    reaches:np.ndarray
+    """Reach of each antenna model in meters."""
+    sectors:list[int]
+    """Number of sectors of each antenna model."""
+
+    def __init__(self, users:Iterable[tuple[float,float]], pylons:Iterable[tuple[float,float]], reaches:list[float], sectors:list[int]|None=None):
+        """Constructor of the LazyEdgeProvider class.
+
+        Parameters
+        ----------
+        users
+            Positions of the UEs.
+        pylons
+            Positions of the pylons.
+        reaches
+            Reach of each antenna model in meters.
+        sectors
+            Number of sectors of each antenna model, omnidirectional models if None.
+        """
+        self.users = PointIndex(users)
+        self.pylons = list(pylons)
+        self.pylon_ids = {p: i for i,p in enumerate(self.pylons)}
+        self.reaches = np.array(reaches, dtype=float)
+        self.sectors = [1] * len(self.reaches) if sectors is None else list(sectors)
+
+    def edges(self, p:tuple[float,float], model:int|None=None) -> tuple[np.ndarray, np.ndarray]:
+        """Generate the edges of a pylon within the reach of an antenna model.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+        model
+            Antenna model index, None to use the maximum reach of all the models.
+
+        Returns
+        -------
+        UE indices and distances of the edges sorted by distance.
+        """
+        reach = np.max(self.reaches) if model is None else self.reaches[model]
+        return self.users.query(p, reach)
+
+    def sector_edges(self, p:tuple[float,float], model:int, sector:int) -> tuple[np.ndarray, np.ndarray]:
+        """Generate the edges of a pylon within the reach and in a sector of an antenna model.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+        model
+            Antenna model index.
+        sector
+            Sector index, see `lib.util.sector_index`.
+
+        Returns
+        -------
+        UE indices and distances of the edges sorted by distance.
+        """
+        idx, dist = self.edges(p, model)
+        n = self.sectors[model]
+        if n == 1:
+            return idx, dist
+        pos = self.users.pos[idx]
+        inside = sector_index(azimuth(p, pos[:,0], pos[:,1]), n) == sector
+        return idx[inside], dist[inside]
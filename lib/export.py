@@ -0,0 +1,227 @@
+import csv
+import zipfile
+import numpy as np
+from os import remove
+from os.path import splitext
+from itertools import islice
+from typing import Iterator
+from lib.topology import Topology, pylon_bandwidth
+
+
+user_columns:tuple[str,...] = ("x", "y", "demand", "pylon", "bandwidth")
+"""Columns of the UE table: position, demand, row of the pylon in the pylon table (-1 if unserved) and allocated bandwidth."""
+pylon_columns:tuple[str,...] = ("x", "y", "height", "antenna", "sectors", "served", "used_bandwidth", "total_bandwidth")
+"""Columns of the pylon table: position, height, antenna model id (-1 if unused), sectors, served UEs and bandwidths."""
+
+export_formats:tuple[str,...] = ("npz", "csv", "parquet")
+"""Available export formats, by file extension."""
+
+
+class ColumnarWriter:
+    """Table written batch by batch to a `.npz`, `.csv` or `.parquet` file, chosen by its extension.
+
+    Only the current batch is held in memory. The CSV rows and Parquet row groups
+    are appended as they come. A `.npz` file needs the total number of rows: the
+    columns are filled in memory-mapped `.npy` files that are zipped on `close`.
+    Parquet needs `pyarrow`, imported on first use.
+    """
+
+    filename:str
+    """File written."""
+    columns:tuple[str,...]
+    """Names of the columns, in order."""
+    rows:int
+    """Number of rows written so far."""
+
+    def __init__(self, filename:str, columns:tuple[str,...], total:int|None=None):
+        """Constructor of the ColumnarWriter class, creates the file.
+
+        Parameters
+        ----------
+        filename
+            File to write, its extension gives the format.
+        columns
+            Names of the columns, in order.
+        total
+            Total number of rows, required for `.npz` files.
+        """
+        self.filename = filename
+        self.columns = columns
+        self.rows = 0
+        self.format = splitext(filename)[1].lstrip(".").lower()
+        if self.format not in export_formats:
+            raise ValueError(f"Unknown export format {self.format}, expected one of {', '.join(export_formats)}")
+
+        if self.format == "csv":
+            self._file = open(filename, "w", newline="")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(columns)
+        elif self.format == "npz":
+            if total is None:
+                raise ValueError("The total number of rows is required to write a .npz file")
+            self._total = total
+            self._parts = {}
+        else:
+            try:
+                import pyarrow # Imported on first use to keep the library import fast
+            except ImportError:
+                raise ImportError("The Parquet export needs pyarrow, install it with: pip install pyarrow")
+            self._parquet = None
+
+    def write(self, batch:dict[str, np.ndarray]) -> None:
+        """Append a batch of rows.
+
+        Parameters
+        ----------
+        batch
+            Array of each column, all of the same length.
+        """
+        n = len(batch[self.columns[0]])
+        if self.format == "csv":
+            # Integers stay integers, floats keep their full precision
+            values = [ batch[c].tolist() for c in self.columns ]
+            self._csv.writerows(zip(*values))
+        elif self.format == "npz":
+            for c in self.columns:
+                if c not in self._parts:
+                    self._parts[c] = np.lib.format.open_memmap(f"{self.filename}.{c}.npy", mode="w+", dtype=batch[c].dtype, shape=(self._total,))
+                self._parts[c][self.rows:self.rows+n] = batch[c]
+        else:
+            import pyarrow as pa # Imported on first use to keep the library import fast
+            import pyarrow.parquet as pq
+
+            table = pa.table({ c: batch[c] for c in self.columns })
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.filename, table.schema)
+            self._parquet.write_table(table)
+        self.rows += n
+
+    def close(self) -> None:
+        """Finish the file."""
+        if self.format == "csv":
+            self._file.close()
+        elif self.format == "npz":
+            if self.rows != self._total:
+                raise ValueError(f"{self.rows} rows written to {self.filename} instead of {self._total}")
+            # The column files are copied into the archive by chunks, as np.load expects them
+            with zipfile.ZipFile(self.filename, "w", allowZip64=True) as archive:
+                for c, part in self._parts.items():
+                    part.flush()
+                    archive.write(f"{self.filename}.{c}.npy", f"{c}.npy")
+            for c in list(self._parts):
+                del self._parts[c]
+                remove(f"{self.filename}.{c}.npy")
+        elif self._parquet is not None:
+            self._parquet.close()
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def pylon_table(topo:Topology) -> dict[str, np.ndarray]:
+    """Columns of the pylon table of an allocated topology, in the `topo.pylons` order.
+
+    Parameters
+    ----------
+    topo
+        Topology object with the remaining bandwidth of each pylon in its graph vertices.
+
+    Returns
+    -------
+    Array of each of the `pylon_columns`.
+    """
+    rows = { p: i for i,p in enumerate(topo.pylons.keys()) }
+    served = np.zeros(len(rows), dtype=np.int64)
+    for user in topo.users.values():
+        if user.pylon is not None:
+            served[rows[user.pylon]] += 1
+    total = np.array([ pylon_bandwidth(topo, p) if pylon.antenna_type != -1 else 0. for p, pylon in topo.pylons.items() ])
+    remaining = np.array([ topo.graph.vertices[p] if pylon.antenna_type != -1 else 0. for p, pylon in topo.pylons.items() ])
+    return {
+        "x": np.array([ p[0] for p in rows ], dtype=float),
+        "y": np.array([ p[1] for p in rows ], dtype=float),
+        "height": np.array([ pylon.height for pylon in topo.pylons.values() ], dtype=float),
+        "antenna": np.array([ pylon.antenna_type for pylon in topo.pylons.values() ], dtype=np.int64),
+        "sectors": np.array([ pylon.sectors for pylon in topo.pylons.values() ], dtype=np.int64),
+        "served": served,
+        "used_bandwidth": total - remaining,
+        "total_bandwidth": total
+    }
+
+
+def user_batches(topo:Topology, batch:int=100000) -> Iterator[dict[str, np.ndarray]]:
+    """Columns of the UE table of an allocated topology, by batches of rows in the `topo.users` order.
+
+    Parameters
+    ----------
+    topo
+        Topology object with the bandwidth of each UE in its graph vertices.
+    batch
+        Number of rows of a batch.
+
+    Yields
+    ------
+    Array of each of the `user_columns`.
+    """
+    rows = { p: i for i,p in enumerate(topo.pylons.keys()) }
+    users = iter(topo.users.values())
+    while chunk := list(islice(users, batch)):
+        served = np.array([ u.pylon is not None for u in chunk ])
+        yield {
+            "x": np.array([ u.pos[0] for u in chunk ], dtype=float),
+            "y": np.array([ u.pos[1] for u in chunk ], dtype=float),
+            "demand": np.array([ u.demand for u in chunk ], dtype=float),
+            "pylon": np.array([ rows[u.pylon] if u.pylon is not None else -1 for u in chunk ], dtype=np.int64),
+            "bandwidth": np.where(served, [ topo.graph.vertices[u.pos] for u in chunk ], 0.)
+        }
+
+
+def export_allocation(topo:Topology, users_file:str, pylons_file:str, batch:int=100000) -> None:
+    """Write the UE and pylon tables of an allocated topology.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    users_file
+        File of the UE table, its extension gives the format (see `ColumnarWriter`).
+    pylons_file
+        File of the pylon table.
+    batch
+        Number of UE rows converted and written at once.
+    """
+    with ColumnarWriter(pylons_file, pylon_columns, len(topo.pylons)) as writer:
+        writer.write(pylon_table(topo))
+    with ColumnarWriter(users_file, user_columns, len(topo.users)) as writer:
+        for columns in user_batches(topo, batch):
+            writer.write(columns)
+
+
+def load_table(filename:str) -> dict[str, np.ndarray]:
+    """Read a table written by a `ColumnarWriter`.
+
+    Parameters
+    ----------
+    filename
+        `.npz`, `.csv` or `.parquet` file.
+
+    Returns
+    -------
+    Array of each column.
+    """
+    extension = splitext(filename)[1].lstrip(".").lower()
+    if extension == "npz":
+        with np.load(filename) as archive:
+            return { c: archive[c] for c in archive.files }
+    if extension == "csv":
+        table = np.genfromtxt(filename, delimiter=",", names=True, dtype=None, encoding=None)
+        return { c: np.atleast_1d(table[c]) for c in table.dtype.names }
+    if extension == "parquet":
+        import pyarrow.parquet as pq # Imported on first use to keep the library import fast
+
+        table = pq.read_table(filename)
+        return { c: table.column(c).to_numpy() for c in table.column_names }
+    raise ValueError(f"Unknown export format {extension}, expected one of {', '.join(export_formats)}")
@@ -1,4 +1,3 @@
-import geopandas as gpd
 from math import pi, sin, cos, atan2, sqrt
 
 
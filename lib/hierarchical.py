@@ -0,0 +1,169 @@
+import numpy as np
+from typing import Callable
+from lib.topology import Topology, Wsolve, link_budget
+from lib.algorithms import qos_density_graph, allocation_summary
+from lib.aggregation import aggregate_users
+from lib.kernels import admit_prefix
+from lib.progress import Progress
+from lib.writer import write_log
+
+
+def edges_bandwidth(topo:Topology, p:tuple[float,float], users:np.ndarray, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> np.ndarray:
+    """Bandwidth a pylon has to allocate to each of some UEs, computed at once.
+
+    Parameters
+    ----------
+    topo
+        Topology object, the pylon must have an antenna model.
+    p
+        Position of the pylon.
+    users
+        Indices of the UEs in `topo.edge_store.users`.
+    pathloss
+        Path loss model to use.
+
+    Returns
+    -------
+    Bandwidth of each UE in Hz, inf if its demand can't be met.
+    """
+    store = topo.edge_store
+    pos = store.users.pos[users]
+    demand = np.array([ topo.users[store.users.keys[j]].demand for j in users.tolist() ], dtype=float)
+    return Wsolve(demand, -174, link_budget(topo, p, (pos[:,0], pos[:,1]), pathloss))
+
+
+def greedy_fill(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], pylons:list[tuple[float,float]], assigned:np.ndarray, W:np.ndarray, remaining:np.ndarray, model:int, progress:Progress|None=None) -> None:
+    """Greedily serve the unassigned UEs, pylon by pylon, the bandwidths of a pylon being computed at once.
+
+    Like `greedy_eu_bandwidth_allocation`, each pylon serves its unassigned UEs by
+    increasing distance until one of them doesn't fit in its remaining bandwidth.
+
+    Parameters
+    ----------
+    topo
+        Topology object, its pylons must have an antenna model.
+    pathloss
+        Path loss model to use.
+    pylons
+        Pylons in the order they allocate their bandwidth.
+    assigned
+        Pylon index (in `topo.edge_store.pylons`) of each UE, -1 if unassigned, updated in place.
+    W
+        Bandwidth allocated to each UE, updated in place.
+    remaining
+        Remaining bandwidth of each pylon, updated in place.
+    model
+        Antenna model whose reach is used.
+    progress
+        Progress counting the pylons.
+    """
+    store = topo.edge_store
+    for p in pylons:
+        i = store.pylon_ids[p]
+        users, _ = store.edges(p, model)
+        users = users[assigned[users] == -1]
+        if len(users):
+            w = edges_bandwidth(topo, p, users, pathloss)
+            served = users[:admit_prefix(w, remaining[i])]
+            assigned[served] = i
+            W[served] = w[:len(served)]
+            remaining[i] -= W[served].sum()
+        if progress is not None:
+            progress.update()
+
+
+def hierarchical_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], cell:float=1000., margin:float|None=None, model:int=0, verbose:bool=False) -> dict[tuple[float,float],str]:
+    """Coarse-to-fine allocation of pylons to end users.
+
+    The greedy first runs on super-UEs aggregating the UEs of `cell` sized square
+    cells, which decides the load of every pylon. Each UE then inherits the pylon
+    of its cell and its exact bandwidth is computed. Only the UEs where the coarse
+    solution is unreliable are then allocated again, at UE resolution and in the
+    greedy pylon order:
+    - the UEs within `margin` of a cell boundary,
+    - the UEs out of the reach of their pylon or whose demand can't be met,
+    - the farthest UEs of the pylons overloaded once the exact bandwidths are known,
+    - the UEs left unserved by the coarse allocation.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    pathloss
+        Path loss model to use.
+    cell
+        Size of the coarse cells in meters.
+    margin
+        Distance to a cell boundary under which the UEs are refined, defaults to a tenth of `cell`.
+    model
+        Antenna model id used by every pylon.
+    verbose
+        Print the progress of the refinement.
+
+    Returns
+    -------
+    dict
+        Pylons allocation, with the same format as `greedy_allocation`.
+    """
+    if topo.edge_store is None:
+        topo.build_edges()
+    if margin is None:
+        margin = cell / 10
+    store = topo.edge_store
+    n_users = len(store.users)
+    capacity = topo.antennas[model].bandwidth
+    reach = topo.antennas[model].reach
+
+    # Coarse allocation on the super-UEs, in the order of the greedy
+    coarse, members = aggregate_users(topo, cell)
+    for p in coarse.pylons.values():
+        p.antenna_type = model
+    sorted_pylons = sorted(coarse.pylons.keys(), key=lambda p: qos_density_graph(coarse, p, model), reverse=True)
+    coarse_assigned = np.full(len(coarse.users), -1, dtype=np.intp)
+    greedy_fill(coarse, pathloss, sorted_pylons, coarse_assigned, np.zeros(len(coarse.users)), np.full(len(coarse.pylons), capacity), model)
+
+    # Pylon of each UE inherited from its cell
+    assigned = np.full(n_users, -1, dtype=np.intp)
+    for s, super_ue in coarse.users.items():
+        i = coarse_assigned[coarse.edge_store.users.ids[s]]
+        if i >= 0:
+            assigned[[ store.users.ids[u] for u in members[super_ue.group] ]] = store.pylon_ids[coarse.edge_store.pylons[i]]
+    W = np.zeros(n_users)
+
+    # UEs close to a cell boundary
+    offset = np.mod(store.users.pos, cell)
+    refine = (np.minimum(offset, cell - offset) < margin).any(axis=1) | (assigned == -1)
+
+    # Exact bandwidths of the coarse assignment, overloaded pylons keep their closest UEs
+    for p in store.pylons:
+        topo.pylons[p].antenna_type = model
+    remaining = np.full(len(store.pylons), capacity)
+    order = np.argsort(assigned, kind='stable')
+    bounds = np.searchsorted(assigned[order], np.arange(len(store.pylons)+1))
+    for i, p in enumerate(store.pylons):
+        users = order[bounds[i]:bounds[i+1]]
+        users = users[~refine[users]]
+        dist = np.hypot(store.users.pos[users,0] - p[0], store.users.pos[users,1] - p[1])
+        users, dist = users[np.argsort(dist, kind='stable')], np.sort(dist)
+        w = edges_bandwidth(topo, p, users, pathloss)
+        keep = (dist <= reach) & np.isfinite(w)
+        candidates = np.flatnonzero(keep)
+        keep[candidates[admit_prefix(w[candidates], capacity):]] = False
+        refine[users[~keep]] = True
+        W[users[keep]] = w[keep]
+        remaining[i] -= w[keep].sum()
+    assigned[refine] = -1
+    write_log(f"Hierarchical allocation: refining {np.count_nonzero(refine)}/{n_users} UEs")
+
+    # Fine allocation of the refined UEs, greedily in the coarse pylons order
+    progress = Progress("Refining towers", len(sorted_pylons), enabled=verbose)
+    greedy_fill(topo, pathloss, sorted_pylons, assigned, W, remaining, model, progress)
+    progress.close()
+
+    # Write the allocation in the topology
+    for i, p in enumerate(store.pylons):
+        topo.graph.vertices[p] = remaining[i]
+    for j, u in enumerate(store.users.keys):
+        topo.users[u].pylon = store.pylons[assigned[j]] if assigned[j] >= 0 else None
+        topo.graph.vertices[u] = W[j] if assigned[j] >= 0 else 0.
+    return allocation_summary(topo)
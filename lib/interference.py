@@ -0,0 +1,163 @@
+import numpy as np
+from typing import Callable
+from lib.topology import Topology, link_budget
+from lib.spatial import PointIndex
+
+
+N0 = -174
+"""Thermal noise density in dBm/Hz."""
+
+
+def dbm_to_mw(x:float|np.ndarray) -> float|np.ndarray:
+    """Convert a power from dBm to mW."""
+    return np.power(10., np.asarray(x) / 10)
+
+
+class InterferenceMap:
+    """Sparse BS x UE received power matrix used to take inter-BS interferences into account.
+
+    Only the pylons with an antenna model set (`antenna_type != -1`) radiate. The
+    row of a pylon only holds the UEs within the reach of its antenna model and
+    receiving more than `threshold` dBm from it. The total received power of each UE
+    (column sums of the matrix) is maintained incrementally so that a pylon can be
+    updated in O(degree) whenever it changes antenna model.
+    """
+
+    topo:Topology
+    """Topology object."""
+    pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]
+    """Path loss model used for the link budgets."""
+    threshold:float
+    """Minimum received power in dBm to store in the matrix."""
+    users:PointIndex
+    """Spatial index of the UEs, its indices are the matrix columns."""
+    rows:dict[tuple[float,float], tuple[np.ndarray, np.ndarray]]
+    """Pylons position and their (UE indices sorted, received powers in mW) row."""
+    total:np.ndarray
+    """Total received power of each UE in mW."""
+
+    def __init__(self, topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], threshold:float=-130.):
+        """Constructor of the InterferenceMap class.
+
+        Parameters
+        ----------
+        topo
+            Topology object.
+        pathloss
+            Path loss model to use.
+        threshold
+            Minimum received power in dBm for a link to be stored.
+        """
+        self.topo = topo
+        self.pathloss = pathloss
+        self.threshold = threshold
+        self.users = PointIndex(topo.users.keys())
+        self.rows = {}
+        self.total = np.zeros(len(self.users))
+        for p in topo.pylons.keys():
+            self.update(p)
+
+    def update(self, p:tuple[float,float]) -> None:
+        """Recompute the row of a pylon, to call after it changed antenna model.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon to update.
+        """
+        # Remove the previous contribution of the pylon
+        if p in self.rows:
+            idx, power = self.rows.pop(p)
+            self.total[idx] -= power
+
+        pylon = self.topo.pylons[p]
+        if pylon.antenna_type == -1:
+            return
+
+        idx, _ = self.users.query(p, self.topo.antennas[pylon.antenna_type].reach, sort=False)
+        pos = self.users.pos[idx]
+        S = link_budget(self.topo, p, (pos[:,0], pos[:,1]), self.pathloss)
+        keep = S >= self.threshold
+        idx, power = idx[keep], dbm_to_mw(S[keep])
+
+        order = np.argsort(idx)
+        self.rows[p] = (idx[order], power[order])
+        self.total[idx] += power
+
+    def signal(self, u:tuple[float,float], p:tuple[float,float]) -> float:
+        """Received power of a UE from a given pylon in mW (0 if not stored)."""
+        if p not in self.rows:
+            return 0.
+        idx, power = self.rows[p]
+        i = self.users.ids[u]
+        j = np.searchsorted(idx, i)
+        return power[j] if j < len(idx) and idx[j] == i else 0.
+
+    def interference(self, u:tuple[float,float], p:tuple[float,float]) -> float:
+        """Power received by a UE from all the pylons except its serving one.
+
+        Parameters
+        ----------
+        u
+            Position of the UE.
+        p
+            Position of the serving pylon.
+
+        Returns
+        -------
+        Interference power in mW.
+        """
+        return max(self.total[self.users.ids[u]] - self.signal(u, p), 0.)
+
+    def noise_density(self, u:tuple[float,float], p:tuple[float,float]) -> float:
+        """Noise plus interference density, spreading the interference over the serving antenna bandwidth.
+
+        It can be used in place of N0 in the cost functions.
+
+        Parameters
+        ----------
+        u
+            Position of the UE.
+        p
+            Position of the serving pylon.
+
+        Returns
+        -------
+        Noise and interference density in dBm/Hz.
+        """
+        bandwidth = self.topo.antennas[self.topo.pylons[p].antenna_type].bandwidth
+        return 10*np.log10(dbm_to_mw(N0) + self.interference(u, p) / bandwidth)
+
+    def sinr(self, u:tuple[float,float], p:tuple[float,float]) -> float:
+        """Signal to Interference plus Noise Ratio over the whole antenna bandwidth.
+
+        Parameters
+        ----------
+        u
+            Position of the UE.
+        p
+            Position of the serving pylon.
+
+        Returns
+        -------
+        Linear SINR value.
+        """
+        bandwidth = self.topo.antennas[self.topo.pylons[p].antenna_type].bandwidth
+        S = dbm_to_mw(link_budget(self.topo, p, u, self.pathloss))
+        return S / (dbm_to_mw(N0) * bandwidth + self.interference(u, p))
+
+    def matrix(self) -> tuple["csr_matrix", list[tuple[float,float]]]:
+        """Assemble the sparse received power matrix.
+
+        Returns
+        -------
+        BS x UE matrix of received powers in mW and the pylons of its rows.
+        UE columns follow `self.users.keys`.
+        """
+        pylons = list(self.rows.keys())
+        indptr = np.zeros(len(pylons)+1, dtype=np.intp)
+        indptr[1:] = np.cumsum([len(self.rows[p][0]) for p in pylons])
+        indices = np.concatenate([self.rows[p][0] for p in pylons]) if pylons else np.zeros(0, dtype=np.intp)
+        data = np.concatenate([self.rows[p][1] for p in pylons]) if pylons else np.zeros(0)
+        from scipy.sparse import csr_matrix # Imported on first use to keep the library import fast
+        return csr_matrix((data, indices, indptr), shape=(len(pylons), len(self.users))), pylons
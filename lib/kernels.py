@@ -0,0 +1,267 @@
+import numpy as np
+from os import environ
+from sys import argv
+from time import perf_counter
+
+
+backend_variable:str = "NETWORK_ALLOCATION_KERNELS"
+"""Environment variable forcing the kernels backend, `numpy` or `numba`, chosen automatically if unset."""
+
+
+# Pure NumPy kernels, vectorized over the whole arrays
+
+def _solve_bandwidth_numpy(C:np.ndarray, N0:np.ndarray, S:np.ndarray, log_lo:float, log_hi:float, iterations:int) -> np.ndarray:
+    lo = np.full(C.shape, log_lo)
+    hi = np.full(C.shape, log_hi)
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        for _ in range(iterations):
+            mid = (lo + hi) / 2
+            w = np.exp(mid)
+            positive = 10*np.log10(w*(np.power(2., C/w) - 1)) - S + N0 > 0
+            lo = np.where(positive, mid, lo)
+            hi = np.where(positive, hi, mid)
+        W = np.exp(hi)
+        limit = 10*np.log10(C*np.log(2)) - S + N0
+        cost = 10*np.log10(W*(np.power(2., C/W) - 1)) - S + N0
+        return np.where((limit <= 0) & (cost <= 1e-6), W, np.inf)
+
+
+def _admit_prefix_numpy(w:np.ndarray, budget:float) -> int:
+    fits = np.cumsum(w) <= budget
+    return len(fits) if fits.all() else int(np.argmin(fits))
+
+
+def _accept_segments_numpy(pylons:np.ndarray, w:np.ndarray, remaining:np.ndarray) -> np.ndarray:
+    cumulated = np.cumsum(w)
+    first = np.searchsorted(pylons, pylons)
+    cumulated -= np.where(first > 0, cumulated[first-1], 0.)
+    return cumulated <= remaining[pylons]
+
+
+# Loop kernels, compiled by Numba when it is installed
+
+def _solve_bandwidth_loop(C:np.ndarray, N0:np.ndarray, S:np.ndarray, log_lo:float, log_hi:float, iterations:int) -> np.ndarray:
+    W = np.empty(len(C))
+    for k in range(len(C)):
+        c, n0, s = C[k], N0[k], S[k]
+        lo, hi = log_lo, log_hi
+        for _ in range(iterations):
+            mid = (lo + hi) / 2
+            w = np.exp(mid)
+            if 10*np.log10(w*(np.power(2., c/w) - 1)) - s + n0 > 0:
+                lo = mid
+            else:
+                hi = mid
+        w = np.exp(hi)
+        # No root if the limit at infinity is positive or if it is out of the bracket
+        if 10*np.log10(c*np.log(2)) - s + n0 <= 0 and 10*np.log10(w*(np.power(2., c/w) - 1)) - s + n0 <= 1e-6:
+            W[k] = w
+        else:
+            W[k] = np.inf
+    return W
+
+
+def _admit_prefix_loop(w:np.ndarray, budget:float) -> int:
+    total = 0.
+    for k in range(len(w)):
+        total += w[k]
+        if not total <= budget:
+            return k
+    return len(w)
+
+
+def _accept_segments_loop(pylons:np.ndarray, w:np.ndarray, remaining:np.ndarray) -> np.ndarray:
+    accepted = np.empty(len(w), dtype=np.bool_)
+    total = 0.
+    for k in range(len(w)):
+        if k == 0 or pylons[k] != pylons[k-1]:
+            total = 0.
+        total += w[k]
+        accepted[k] = total <= remaining[pylons[k]]
+    return accepted
+
+
+_numpy_kernels = {
+    "solve_bandwidth": _solve_bandwidth_numpy,
+    "admit_prefix": _admit_prefix_numpy,
+    "accept_segments": _accept_segments_numpy,
+}
+_loop_kernels = {
+    "solve_bandwidth": _solve_bandwidth_loop,
+    "admit_prefix": _admit_prefix_loop,
+    "accept_segments": _accept_segments_loop,
+}
+_backend:str|None = None
+_kernels:dict = {}
+
+
+def set_backend(name:str|None=None) -> str:
+    """Select the kernels backend.
+
+    Parameters
+    ----------
+    name
+        `numba` or `numpy`, defaults to the `NETWORK_ALLOCATION_KERNELS` environment
+        variable, then to `numba` if it is installed and `numpy` otherwise.
+
+    Returns
+    -------
+    Name of the selected backend.
+    """
+    global _backend, _kernels
+    if name is None:
+        name = environ.get(backend_variable, "")
+    if name not in ("", "numba", "numpy"):
+        raise ValueError(f"Unknown kernels backend {name}, expected numba or numpy")
+    if name != "numpy":
+        try:
+            # Imported on first use to keep the library import fast
+            from numba import njit
+            _kernels = { k: njit(cache=True, nogil=True)(f) for k,f in _loop_kernels.items() }
+            _backend = "numba"
+            return _backend
+        except ImportError:
+            if name == "numba":
+                raise
+    _kernels = dict(_numpy_kernels)
+    _backend = "numpy"
+    return _backend
+
+
+def backend() -> str:
+    """Name of the kernels backend in use, selected on the first call to a kernel."""
+    return _backend if _backend is not None else set_backend()
+
+
+def _kernel(name:str):
+    if _backend is None:
+        set_backend()
+    return _kernels[name]
+
+
+def solve_bandwidth(C:np.ndarray, N0:np.ndarray, S:np.ndarray, log_lo:float, log_hi:float, iterations:int) -> np.ndarray:
+    """Bisection on the log bandwidth of the cost function of many links (see `lib.topology.Wsolve`).
+
+    Parameters
+    ----------
+    C
+        1D float array of the user equipment demands in bits per second.
+    N0
+        1D float array of the noise densities in dBm/Hz.
+    S
+        1D float array of the signal powers in dB.
+    log_lo
+        Logarithm of the lowest bandwidth searched.
+    log_hi
+        Logarithm of the highest bandwidth searched.
+    iterations
+        Number of bisection steps.
+
+    Returns
+    -------
+    Bandwidth of each link in Hz, `np.inf` where the cost function has no root.
+    """
+    return _kernel("solve_bandwidth")(C, N0, S, log_lo, log_hi, iterations)
+
+
+def admit_prefix(w:np.ndarray, budget:float) -> int:
+    """Number of leading bandwidths of `w` whose running sum fits in `budget`.
+
+    Parameters
+    ----------
+    w
+        1D float array of the bandwidths in the admission order.
+    budget
+        Available bandwidth.
+
+    Returns
+    -------
+    Length of the admitted prefix.
+    """
+    return _kernel("admit_prefix")(w, budget)
+
+
+def accept_segments(pylons:np.ndarray, w:np.ndarray, remaining:np.ndarray) -> np.ndarray:
+    """Admission of bids grouped by pylon: a bid is accepted if the running sum of its pylon's bids fits.
+
+    Parameters
+    ----------
+    pylons
+        1D int array of the pylon of each bid, sorted.
+    w
+        1D float array of the bandwidth of each bid, in the admission order within a pylon.
+    remaining
+        Remaining bandwidth of each pylon.
+
+    Returns
+    -------
+    Boolean array of the accepted bids.
+    """
+    return _kernel("accept_segments")(pylons, w, remaining)
+
+
+def compare_backends(size:int=10_000, seed:int=0) -> dict[str, float]:
+    """Check that the NumPy and loop kernels give the same results on random inputs.
+
+    The loop kernels are compiled if Numba is installed and run as plain Python
+    otherwise, which is slow but still checks them.
+
+    Parameters
+    ----------
+    size
+        Number of random links and bids.
+    seed
+        Seed of the random inputs.
+
+    Returns
+    -------
+    Largest discrepancy found for each kernel, 0 when the backends agree.
+    """
+    rng = np.random.default_rng(seed)
+    try:
+        from numba import njit
+        loops = { k: njit(cache=True, nogil=True)(f) for k,f in _loop_kernels.items() }
+    except ImportError:
+        loops = _loop_kernels
+
+    C = rng.uniform(1e3, 1e7, size)
+    N0 = np.full(size, -174.)
+    S = rng.uniform(-140, -40, size)
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        a = _numpy_kernels["solve_bandwidth"](C, N0, S, np.log(1), np.log(1e22), 64)
+        b = loops["solve_bandwidth"](C, N0, S, np.log(1), np.log(1e22), 64)
+    finite = np.isfinite(a)
+    discrepancies = {
+        "solve_bandwidth": float(np.max(np.abs(a[finite] - b[finite]) / a[finite], initial=0.)) + float(np.count_nonzero(finite != np.isfinite(b)))
+    }
+
+    w = rng.exponential(1e5, size)
+    budget = w.sum() / 2
+    discrepancies["admit_prefix"] = float(abs(_numpy_kernels["admit_prefix"](w, budget) - loops["admit_prefix"](w, budget)))
+
+    pylons = np.sort(rng.integers(0, max(size // 50, 1), size))
+    remaining = np.bincount(pylons, weights=w) / 2
+    discrepancies["accept_segments"] = float(np.count_nonzero(
+        _numpy_kernels["accept_segments"](pylons, w, remaining) != loops["accept_segments"](pylons, w, remaining)
+    ))
+    return discrepancies
+
+
+if __name__ == '__main__':
+    from lib.arg_parser import parse_arguments
+
+    args = parse_arguments(
+        [
+            ("--size", "Sets the number of random links checked (default: 10000)", int),
+            ("--seed", "Sets the seed of the random links (default: 0)", int)
+        ],
+        argv,
+        "== Python tool to check that the NumPy and Numba kernels give the same results =="
+    )
+
+    size = args.get("--size", 10_000)
+    print(f"Backend in use: {backend()}")
+    start = perf_counter()
+    for name, d in compare_backends(size, args.get("--seed", 0)).items():
+        print(f"{name}: {'OK' if d <= 1e-9 else 'MISMATCH'} (largest discrepancy {d:.3g})")
+    print(f"Checked {size} random links in {perf_counter() - start:.2f}s")
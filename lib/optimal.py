@@ -0,0 +1,98 @@
+import numpy as np
+from scipy.optimize import milp, LinearConstraint, Bounds
+from scipy.sparse import csr_matrix, vstack
+from typing import Callable
+from lib.topology import Topology
+from lib.algorithms import compute_W_edges, apply_edges_allocation, allocation_summary
+from lib.writer import write_log
+
+
+def cheapest_candidates(u_idx:np.ndarray, W:np.ndarray, k:int) -> np.ndarray:
+    """Select the edges of each UE among its k cheapest ones.
+
+    Parameters
+    ----------
+    u_idx
+        UE index of each edge.
+    W
+        Bandwidth to allocate on each edge.
+    k
+        Maximum number of edges to keep per UE.
+
+    Returns
+    -------
+    Indices of the kept edges.
+    """
+    order = np.lexsort((W, u_idx))
+    sorted_users = u_idx[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_users, sorted_users)
+    return np.sort(order[rank < k])
+
+
+def optimal_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], model:int=0, candidates:int|None=None, time_limit:float|None=None) -> dict[tuple[float,float],str]:
+    """Exact allocation of pylons to end users, used as a quality reference for the greedy.
+
+    The assignment is a sparse 0/1 program with one variable per feasible edge:
+    each UE is served by at most one pylon and the bandwidth allocated by a pylon
+    can't exceed its antenna bandwidth. The number of served UEs is maximised,
+    then the total allocated bandwidth is minimised.
+
+    The result is exact when `candidates` is None. On large instances, limiting
+    each UE to its few cheapest pylons keeps the program small enough to be
+    solved in seconds, at the cost of exactness.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    pathloss
+        Path loss model to use.
+    model
+        Antenna model id used by every pylon.
+    candidates
+        Number of cheapest pylons to consider for each UE, None to consider all of them.
+    time_limit
+        Maximum solving time in seconds, None for no limit.
+
+    Returns
+    -------
+    dict
+        Pylons allocation, with the same format as `greedy_allocation`.
+    """
+    p_idx, u_idx, W = compute_W_edges(topo, pathloss, model)
+    store = topo.edge_store
+    capacity = topo.antennas[model].bandwidth
+
+    # Only keep the edges a pylon could afford on its own
+    feasible = W <= capacity
+    p_idx, u_idx, W = p_idx[feasible], u_idx[feasible], W[feasible]
+    if candidates is not None:
+        kept = cheapest_candidates(u_idx, W, candidates)
+        p_idx, u_idx, W = p_idx[kept], u_idx[kept], W[kept]
+    n = len(W)
+    write_log(f"Optimal allocation: {n} feasible edges for {len(store.users)} UEs and {len(store.pylons)} pylons")
+
+    # Sparse constraints: one row per UE (served at most once) and one per pylon (bandwidth)
+    # The pylons rows are scaled by the capacity to keep the coefficients of the same magnitude
+    edges = np.arange(n)
+    A_users = csr_matrix((np.ones(n), (u_idx, edges)), shape=(len(store.users), n))
+    A_pylons = csr_matrix((W / capacity, (p_idx, edges)), shape=(len(store.pylons), n))
+    constraints = LinearConstraint(
+        vstack([A_users, A_pylons], format="csr"),
+        -np.inf,
+        np.ones(len(store.users) + len(store.pylons))
+    )
+
+    # Each served UE counts for -1, the bandwidth term sums to less than 1 so it only breaks ties
+    c = -1. + W / (W.sum() + 1.)
+    options = {"disp": False} if time_limit is None else {"disp": False, "time_limit": time_limit}
+    res = milp(c, constraints=constraints, integrality=np.ones(n), bounds=Bounds(0, 1), options=options)
+    write_log(f"Optimal allocation solver: {res.message}")
+    if res.x is None:
+        print(f"ERROR: the solver did not find a solution ({res.message})")
+        return {}
+
+    chosen = res.x > .5
+    apply_edges_allocation(topo, model, p_idx[chosen], u_idx[chosen], W[chosen])
+
+    return allocation_summary(topo)
@@ -0,0 +1,142 @@
+import heapq
+import numpy as np
+from lib.topology import Topology
+from lib.edges import LazyEdgeProvider
+from lib.spatial import PointIndex
+
+
+class DensityQueue:
+    """Pylons ordered by the QoS density of their still unserved UEs, kept up to date as UEs get served.
+
+    The density of a pylon is the `qos_density_graph` formula (mean of demand / distance)
+    restricted to its unserved UEs. Its sum and count are maintained per pylon: when UEs
+    are served, their terms are subtracted from the pylons having them as neighbours
+    only, with segment sums over the edge arrays. Updated pylons are pushed again in a
+    heap and their older entries are skipped when popped (lazy invalidation).
+
+    With a `LazyEdgeProvider`, the edges are never all held at once: the initial
+    densities are computed one pylon at a time and the pylons neighbouring the
+    served UEs are found with a spatial index of the pylons, keeping the peak memory
+    bounded by the maximum degree of a pylon or of a batch of served UEs.
+    """
+
+    pylons:list[tuple[float,float]]
+    """Positions of the pylons, in the edge store order."""
+    sums:np.ndarray
+    """Sum of demand / distance over the unserved UEs of each pylon."""
+    counts:np.ndarray
+    """Number of unserved UEs of each pylon."""
+
+    def __init__(self, topo:Topology, model:int):
+        """Constructor of the DensityQueue class, computes the density of every pylon.
+
+        Parameters
+        ----------
+        topo
+            Topology object with its edges built.
+        model
+            Antenna model whose reach defines the neighbours of a pylon.
+        """
+        store = topo.edge_store
+        self.pylons = store.pylons
+        demand = np.array([ topo.users[u].demand for u in store.users.keys ], dtype=float)
+
+        self._demand = demand
+        self._reach = topo.antennas[model].reach
+        if isinstance(store, LazyEdgeProvider):
+            self.sums = np.zeros(len(self.pylons))
+            self.counts = np.zeros(len(self.pylons), dtype=np.intp)
+            for i,p in enumerate(self.pylons):
+                users, dist = store.edges(p, model)
+                with np.errstate(divide="ignore"):
+                    self.sums[i] = np.sum(demand[users] / dist)
+                self.counts[i] = len(users)
+            # The edges of the served UEs are found from the pylons side when needed
+            self._user_pos = store.users.pos
+            self._pylon_index = PointIndex(self.pylons)
+        else:
+            # Edges within the reach of the model, grouped by pylon
+            edges = [ store.edges(p, model) for p in self.pylons ]
+            p_idx = np.repeat(np.arange(len(self.pylons)), [ len(users) for users,_ in edges ])
+            u_idx = np.concatenate([ users for users,_ in edges ]) if edges else np.zeros(0, dtype=np.intp)
+            dist = np.concatenate([ d for _,d in edges ]) if edges else np.zeros(0)
+            with np.errstate(divide="ignore"):
+                terms = demand[u_idx] / dist
+
+            self.sums = np.bincount(p_idx, weights=terms, minlength=len(self.pylons))
+            self.counts = np.bincount(p_idx, minlength=len(self.pylons))
+
+            # Same edges grouped by UE, to find the pylons affected by a served UE
+            order = np.argsort(u_idx, kind='stable')
+            self._user_ptr = np.searchsorted(u_idx[order], np.arange(len(store.users)+1))
+            self._user_pylons = p_idx[order]
+            self._user_terms = terms[order]
+            self._pylon_index = None
+
+        self._served = np.zeros(len(store.users), dtype=bool)
+        self._popped = np.zeros(len(self.pylons), dtype=bool)
+        self._version = np.zeros(len(self.pylons), dtype=np.intp)
+        # Entries are (-density, pylon index, version), ties are broken by the pylons order
+        self._heap = [ (-d, i, 0) for i,d in enumerate(self.densities().tolist()) ]
+        heapq.heapify(self._heap)
+
+    def densities(self) -> np.ndarray:
+        """Current density of every pylon, 0 for the pylons without unserved UEs."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.counts > 0, self.sums / np.maximum(self.counts, 1), 0.)
+
+    def pop(self) -> tuple[float,float]|None:
+        """Remove and return the pylon with the highest current density, None once every pylon was popped."""
+        while self._heap:
+            _, i, version = heapq.heappop(self._heap)
+            if version == self._version[i] and not self._popped[i]:
+                self._popped[i] = True
+                return self.pylons[i]
+        return None
+
+    def serve(self, users:np.ndarray) -> None:
+        """Remove served UEs from the density of their neighbouring pylons.
+
+        Parameters
+        ----------
+        users
+            Indices (in the edge store) of the newly served UEs.
+        """
+        users = np.unique(users)
+        users = users[~self._served[users]]
+        if len(users) == 0:
+            return
+        self._served[users] = True
+
+        pylons, terms = self._user_edges(users)
+        self.sums -= np.bincount(pylons, weights=terms, minlength=len(self.pylons))
+        self.counts -= np.bincount(pylons, minlength=len(self.pylons))
+
+        # Only the affected pylons still in the queue get a new entry
+        affected = np.unique(pylons)
+        affected = affected[~self._popped[affected]]
+        self._version[affected] += 1
+        counts = self.counts[affected]
+        densities = np.where(counts > 0, self.sums[affected] / np.maximum(counts, 1), 0.)
+        for i, d, v in zip(affected.tolist(), densities.tolist(), self._version[affected].tolist()):
+            heapq.heappush(self._heap, (-d, i, v))
+
+    def _user_edges(self, users:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Pylon index and demand / distance term of the edges of some UEs."""
+        if self._pylon_index is None:
+            # Gathered from the UE grouped arrays
+            starts, ends = self._user_ptr[users], self._user_ptr[users+1]
+            lengths = ends - starts
+            edges = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            return self._user_pylons[edges], self._user_terms[edges]
+        pylons, terms = [], []
+        for j in users.tolist():
+            idx, dist = self._pylon_index.query(self._user_pos[j], self._reach, sort=False)
+            pylons.append(idx)
+            with np.errstate(divide="ignore"):
+                terms.append(self._demand[j] / dist)
+        return np.concatenate(pylons), np.concatenate(terms)
+
+    def __len__(self) -> int:
+        """Number of pylons not popped yet."""
+        return int(np.count_nonzero(~self._popped))
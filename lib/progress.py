@@ -0,0 +1,129 @@
+from sys import stdout
+from time import perf_counter
+from typing import Iterable, Iterator, TextIO, TypeVar
+
+T = TypeVar("T")
+
+
+def format_duration(seconds:float) -> str:
+    """Format a duration in seconds as H:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+    """Progress reporter whose output is rate limited by the elapsed time rather than by the iterations.
+
+    Counting an item only costs an addition and a clock read, the progress line
+    (done/total, items/s and ETA) is only rewritten every `interval` seconds, so
+    it can be updated from the innermost loops.
+    """
+
+    label:str
+    """Description of the counted items."""
+    total:int|None
+    """Expected number of items, None if unknown."""
+    done:int
+    """Number of items counted so far."""
+    interval:float
+    """Minimum time between two reports in seconds."""
+    enabled:bool
+    """Whether the progress is printed, the items are counted anyway."""
+
+    def __init__(self, label:str, total:int|None=None, interval:float=.5, enabled:bool=True, stream:TextIO=stdout):
+        """Constructor of the Progress class, starts the clock.
+
+        Parameters
+        ----------
+        label
+            Description of the counted items.
+        total
+            Expected number of items, None if unknown.
+        interval
+            Minimum time between two reports in seconds.
+        enabled
+            Whether the progress is printed.
+        stream
+            Stream to print the progress to.
+        """
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.enabled = enabled
+        self.stream = stream
+        self.start = perf_counter()
+        self._next_report = self.start + interval
+        self._width = 0
+
+    @property
+    def elapsed(self) -> float:
+        """Time since the start in seconds."""
+        return perf_counter() - self.start
+
+    @property
+    def rate(self) -> float:
+        """Average number of items per second."""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.
+
+    def update(self, n:int=1) -> None:
+        """Count `n` more items and report the progress if the last report is old enough."""
+        self.done += n
+        if self.enabled and perf_counter() >= self._next_report:
+            self.report()
+
+    def report(self, end:str='') -> None:
+        """Print the progress line now."""
+        now = perf_counter()
+        self._next_report = now + self.interval
+        rate = self.done / (now - self.start) if now > self.start else 0.
+        line = f"\r{self.label}: {self.done}"
+        if self.total is not None:
+            line += f"/{self.total} ({100 * self.done / max(self.total, 1):5.1f}%)"
+        line += f" - {rate:.1f} it/s"
+        if self.total is not None and end == '':
+            line += f" - ETA {format_duration((self.total - self.done) / rate) if rate > 0 else '?'}"
+        else:
+            line += f" - {format_duration(now - self.start)}"
+        # Pad with spaces to erase the end of a longer previous line
+        self._width = max(self._width, len(line))
+        self.stream.write(line.ljust(self._width) + end)
+        self.stream.flush()
+
+    def close(self) -> None:
+        """Print the final progress line."""
+        if self.enabled:
+            self.report('\n')
+
+    def __enter__(self) -> "Progress":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def track(items:Iterable[T], label:str, total:int|None=None, **kwargs) -> Iterator[T]:
+    """Iterate over items while reporting the progress.
+
+    Parameters
+    ----------
+    items
+        Items to iterate over.
+    label
+        Description of the items.
+    total
+        Number of items, defaults to `len(items)` when available.
+    kwargs
+        Other `Progress` arguments.
+
+    Returns
+    -------
+    The items.
+    """
+    if total is None and hasattr(items, "__len__"):
+        total = len(items)
+    with Progress(label, total, **kwargs) as progress:
+        for item in items:
+            yield item
+            progress.update()
@@ -0,0 +1,159 @@
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from weakref import finalize
+from lib.topology import Topology
+from lib.edges import EdgeStore
+
+
+def _release(segments:list[SharedMemory], unlink:bool) -> None:
+    """Close shared memory segments and unlink them if they are owned."""
+    for shm in segments:
+        try:
+            shm.close()
+        except BufferError:# Some views are still alive, the mapping is freed with the last one
+            pass
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _attach_segment(name:str) -> SharedMemory:
+    """Attach an existing segment without letting this process destroy it."""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks the attached segments, which is harmless for the
+        # worker processes since they share the resource tracker of their parent
+        return SharedMemory(name=name)
+
+
+class SharedArrays:
+    """NumPy arrays published in shared memory segments, to be used by many processes without copies.
+
+    The publishing process owns the segments and unlinks them when it closes.
+    Its worker processes attach to them from the picklable `descriptor` and only
+    get read-only views. The segments are released when `close` is called, when the
+    object is garbage collected or when the interpreter exits.
+    """
+
+    arrays:dict[str, np.ndarray]
+    """Name of the arrays and their view on the shared memory."""
+    descriptor:dict[str, tuple[str, tuple[int,...], str]]
+    """Name of the arrays and their (segment name, shape, dtype), to send to the other processes."""
+    owner:bool
+    """Whether this process created the segments."""
+
+    def __init__(self, segments:list[SharedMemory], descriptor:dict[str, tuple[str, tuple[int,...], str]], owner:bool):
+        """Wrap already created or attached segments, use `publish` or `attach` instead."""
+        self.descriptor = descriptor
+        self.owner = owner
+        self.arrays = {}
+        for shm, (key, (_, shape, dtype)) in zip(segments, descriptor.items()):
+            self.arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            if not owner:
+                self.arrays[key].flags.writeable = False
+        self._finalizer = finalize(self, _release, segments, owner)
+
+    @classmethod
+    def publish(cls, arrays:dict[str, np.ndarray]) -> "SharedArrays":
+        """Copy arrays into new shared memory segments.
+
+        Parameters
+        ----------
+        arrays
+            Name of the arrays to publish and their values.
+
+        Returns
+        -------
+        SharedArrays owning the segments.
+        """
+        segments = []
+        descriptor = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            segments.append(shm)
+            descriptor[key] = (shm.name, array.shape, array.dtype.str)
+        return cls(segments, descriptor, True)
+
+    @classmethod
+    def attach(cls, descriptor:dict[str, tuple[str, tuple[int,...], str]]) -> "SharedArrays":
+        """Attach to arrays published by another process.
+
+        Parameters
+        ----------
+        descriptor
+            `descriptor` of the published SharedArrays.
+
+        Returns
+        -------
+        SharedArrays with read-only views on the segments.
+        """
+        return cls([ _attach_segment(name) for name, _, _ in descriptor.values() ], descriptor, False)
+
+    def close(self) -> None:
+        """Release the segments, the arrays must not be used afterwards."""
+        self.arrays = {}
+        self._finalizer()
+
+    def __getitem__(self, key:str) -> np.ndarray:
+        return self.arrays[key]
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def topology_arrays(topo:Topology) -> dict[str, np.ndarray]:
+    """Gather the coordinates, demands, heights and edges of a topology as arrays.
+
+    The UEs and pylons follow the order of `topo.edge_store`, which is built if needed.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+
+    Returns
+    -------
+    Name of the arrays and their values.
+    """
+    if topo.edge_store is None:
+        topo.build_edges()
+    store = topo.edge_store
+    arrays = {
+        "users_pos": store.users.pos,
+        "users_demand": np.array([ topo.users[u].demand for u in store.users.keys ], dtype=float),
+        "pylons_pos": np.array(store.pylons, dtype=float).reshape(-1, 2),
+        "pylons_height": np.array([ topo.pylons[p].height for p in store.pylons ], dtype=float),
+        "pylons_antenna": np.array([ topo.pylons[p].antenna_type for p in store.pylons ], dtype=np.int32),
+        "reaches": store.reaches
+    }
+    if isinstance(store, EdgeStore):
+        arrays |= {
+            "edges_indptr": store.indptr,
+            "edges_user": store.user_idx,
+            "edges_dist": store.dist,
+            "edges_cutoffs": store.cutoffs
+        }
+    return arrays
+
+
+def publish_topology(topo:Topology) -> SharedArrays:
+    """Publish the arrays of a topology in shared memory for worker processes.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+
+    Returns
+    -------
+    SharedArrays owning the segments, send its `descriptor` to the workers.
+    """
+    return SharedArrays.publish(topology_arrays(topo))
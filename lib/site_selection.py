@@ -0,0 +1,122 @@
+import heapq
+import numpy as np
+from typing import Callable
+from lib.topology import Topology
+from lib.algorithms import compute_W_edges, allocation_summary
+from lib.kernels import admit_prefix
+from lib.progress import Progress
+from lib.writer import write_log
+
+
+def site_gain(indptr:np.ndarray, u_idx:np.ndarray, W:np.ndarray, served:np.ndarray, i:int, capacity:float) -> np.ndarray:
+    """Edges a candidate site would serve if it was activated now.
+
+    The site serves its cheapest unserved UEs first, which maximises the number
+    of UEs fitting in its bandwidth.
+
+    Parameters
+    ----------
+    indptr
+        Start offset of the edges of each site.
+    u_idx
+        UE index of each edge, the edges of a site being sorted by increasing bandwidth.
+    W
+        Bandwidth to allocate on each edge.
+    served
+        Whether each UE is already served.
+    i
+        Index of the site.
+    capacity
+        Bandwidth of the antenna model.
+
+    Returns
+    -------
+    Indices of the served edges, their count is the marginal gain of the site.
+    """
+    start, end = indptr[i], indptr[i+1]
+    free = start + np.flatnonzero(~served[u_idx[start:end]])
+    return free[:admit_prefix(W[free], capacity)]
+
+
+def site_selection(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], model:int=0, max_sites:int|None=None, verbose:bool=False) -> dict[tuple[float,float],str]:
+    """Activate a small subset of the candidate pylons that serves every UE.
+
+    Pylons are activated one at a time, always the one serving the most still
+    unserved UEs (lazy greedy). The gain of a pylon can only decrease when other
+    pylons are activated, so the candidates are kept in a priority queue keyed by
+    their last known gain and a gain is only recomputed when its candidate reaches
+    the top of the queue: if it is still the best gain, the candidate is activated
+    without looking at the others.
+
+    Parameters
+    ----------
+    topo
+        Topology object, the pylons left unused get the -1 antenna type.
+    pathloss
+        Path loss model to use.
+    model
+        Antenna model id used by the activated pylons.
+    max_sites
+        Maximum number of pylons to activate, None to stop when every UE is served or no pylon can serve more.
+    verbose
+        Print the progress of the selection.
+
+    Returns
+    -------
+    Allocation of the activated pylons, with the same format as `greedy_allocation`.
+    """
+    p_idx, u_idx, W = compute_W_edges(topo, pathloss, model)
+    store = topo.edge_store
+    capacity = topo.antennas[model].bandwidth
+    n_users = len(store.users)
+
+    # Edges grouped by pylon, cheapest first
+    feasible = W <= capacity
+    p_idx, u_idx, W = p_idx[feasible], u_idx[feasible], W[feasible]
+    order = np.lexsort((W, p_idx))
+    p_idx, u_idx, W = p_idx[order], u_idx[order], W[order]
+    indptr = np.searchsorted(p_idx, np.arange(len(store.pylons)+1))
+
+    # Queue of (-gain, pylon, number of activated pylons when the gain was computed)
+    served = np.zeros(n_users, dtype=bool)
+    heap = [ (-len(site_gain(indptr, u_idx, W, served, i, capacity)), i, 0) for i in range(len(store.pylons)) ]
+    heapq.heapify(heap)
+    evaluations = len(heap)
+
+    assigned = np.full(n_users, -1, dtype=np.intp)
+    allocated = np.zeros(n_users)
+    selected = []
+    progress = Progress("Selecting sites", n_users, enabled=verbose)
+    while heap and heap[0][0] < 0 and (max_sites is None or len(selected) < max_sites):
+        _, i, stamp = heapq.heappop(heap)
+        chosen = site_gain(indptr, u_idx, W, served, i, capacity)
+        if stamp != len(selected):
+            # Outdated gain, the candidate goes back in the queue unless it is still the best
+            evaluations += 1
+            if heap and (-len(chosen), i) > heap[0][:2]:
+                heapq.heappush(heap, (-len(chosen), i, len(selected)))
+                continue
+            if len(chosen) == 0:
+                continue
+        users = u_idx[chosen]
+        served[users] = True
+        assigned[users] = i
+        allocated[users] = W[chosen]
+        selected.append(i)
+        progress.update(len(chosen))
+    progress.close()
+    write_log(f"Site selection: {len(selected)}/{len(store.pylons)} sites activated, {evaluations} gain evaluations, {np.count_nonzero(served)}/{n_users} UEs served")
+
+    # Write the allocation in the topology, the other pylons are left unused
+    used = np.bincount(assigned[served], weights=allocated[served], minlength=len(store.pylons))
+    for p in store.pylons:
+        topo.pylons[p].antenna_type = -1
+        topo.graph.vertices[p] = 0.
+    for i in selected:
+        p = store.pylons[i]
+        topo.pylons[p].antenna_type = model
+        topo.graph.vertices[p] = capacity - used[i]
+    for j, u in enumerate(store.users.keys):
+        topo.users[u].pylon = store.pylons[assigned[j]] if assigned[j] >= 0 else None
+        topo.graph.vertices[u] = allocated[j]
+    return allocation_summary(topo)
@@ -0,0 +1,184 @@
+import numpy as np
+from typing import Iterable
+
+
+class PointIndex:
+    """Spatial index over a fixed set of 2D points (UEs or pylons)."""
+
+    keys:list[tuple[float,float]]
+    """Positions of the indexed points, in insertion order."""
+    pos:np.ndarray
+    """(N,2) array of the indexed positions in meters."""
+    ids:dict[tuple[float,float], int]
+    """Position of a point and its index in `keys` and `pos`."""
+    tree:"cKDTree"
+    """KD-tree built on `pos`."""
+
+    def __init__(self, points:Iterable[tuple[float,float]]):
+        """Constructor of the PointIndex class.
+
+        Parameters
+        ----------
+        points
+            Positions to index.
+        """
+        from scipy.spatial import cKDTree # Imported on first use to keep the library import fast
+
+        self.keys = list(points)
+        self.pos = np.array(self.keys, dtype=float).reshape(-1, 2)
+        self.ids = {k: i for i,k in enumerate(self.keys)}
+        self.tree = cKDTree(self.pos)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def query(self, center:tuple[float,float], radius:float, sort:bool=True) -> tuple[np.ndarray, np.ndarray]:
+        """Find the indexed points within a given distance of a position.
+
+        Parameters
+        ----------
+        center
+            Position to search around.
+        radius
+            Maximum distance in meters (inclusive).
+        sort
+            Sort the results by increasing distance.
+
+        Returns
+        -------
+        Indices of the points found and their distance to `center`.
+        """
+        idx = np.array(self.tree.query_ball_point(center, radius), dtype=np.intp)
+        d = np.hypot(self.pos[idx,0] - center[0], self.pos[idx,1] - center[1])
+        if sort:
+            order = np.argsort(d, kind='stable')
+            idx, d = idx[order], d[order]
+        return idx, d
+
+
+class GridIndex:
+    """Spatial index over a changing set of 2D points, bucketed on a uniform grid.
+
+    Adding, moving or removing a point only touches its grid cell, so the index is
+    kept up to date point by point instead of being rebuilt like a `PointIndex`.
+    A query scans the cells overlapping its disk, which is cheap when the cell size
+    is close to the query radius.
+    """
+
+    cell:float
+    """Size of a grid cell in meters."""
+    keys:list[object]
+    """Key of each slot, None for the free slots."""
+    pos:np.ndarray
+    """(slots,2) array of the indexed positions in meters."""
+    ids:dict[object, int]
+    """Key of a point and its slot in `keys` and `pos`."""
+    cells:dict[tuple[int,int], list[int]]
+    """Slots of the points in each non empty grid cell."""
+
+    def __init__(self, cell:float, points:Iterable[tuple[object, tuple[float,float]]]=()):
+        """Constructor of the GridIndex class.
+
+        Parameters
+        ----------
+        cell
+            Size of a grid cell in meters, usually the radius of the queries.
+        points
+            Initial (key, position) pairs to index.
+        """
+        self.cell = float(cell)
+        self.keys = []
+        self.pos = np.zeros((16, 2))
+        self.ids = {}
+        self.cells = {}
+        self._free = []
+        for key, p in points:
+            self.add(key, p)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cell(self, p:tuple[float,float]) -> tuple[int,int]:
+        return (int(np.floor(p[0] / self.cell)), int(np.floor(p[1] / self.cell)))
+
+    def add(self, key:object, p:tuple[float,float]) -> int:
+        """Index a point, moving it if its key is already indexed.
+
+        Parameters
+        ----------
+        key
+            Hashable key of the point.
+        p
+            Position of the point.
+
+        Returns
+        -------
+        Slot of the point.
+        """
+        if key in self.ids:
+            i = self.ids[key]
+            old, new = self._cell(self.pos[i]), self._cell(p)
+            if old != new:
+                self.cells[old].remove(i)
+                if not self.cells[old]:
+                    del self.cells[old]
+                self.cells.setdefault(new, []).append(i)
+            self.pos[i] = p
+            return i
+
+        if self._free:
+            i = self._free.pop()
+            self.keys[i] = key
+        else:
+            i = len(self.keys)
+            self.keys.append(key)
+            if i == len(self.pos):
+                self.pos = np.concatenate((self.pos, np.zeros_like(self.pos)))
+        self.pos[i] = p
+        self.ids[key] = i
+        self.cells.setdefault(self._cell(p), []).append(i)
+        return i
+
+    def remove(self, key:object) -> int:
+        """Remove a point from the index, its slot will be reused.
+
+        Parameters
+        ----------
+        key
+            Key of the point.
+
+        Returns
+        -------
+        Former slot of the point.
+        """
+        i = self.ids.pop(key)
+        c = self._cell(self.pos[i])
+        self.cells[c].remove(i)
+        if not self.cells[c]:
+            del self.cells[c]
+        self.keys[i] = None
+        self._free.append(i)
+        return i
+
+    def query(self, center:tuple[float,float], radius:float) -> tuple[np.ndarray, np.ndarray]:
+        """Find the indexed points within a given distance of a position, by increasing distance.
+
+        Parameters
+        ----------
+        center
+            Position to search around.
+        radius
+            Maximum distance in meters (inclusive).
+
+        Returns
+        -------
+        Slots of the points found and their distance to `center`.
+        """
+        (x0, y0), (x1, y1) = self._cell((center[0] - radius, center[1] - radius)), self._cell((center[0] + radius, center[1] + radius))
+        idx = [ i for cx in range(x0, x1+1) for cy in range(y0, y1+1) for i in self.cells.get((cx, cy), ()) ]
+        idx = np.array(idx, dtype=np.intp)
+        d = np.hypot(self.pos[idx,0] - center[0], self.pos[idx,1] - center[1])
+        inside = d <= radius
+        idx, d = idx[inside], d[inside]
+        order = np.argsort(d, kind='stable')
+        return idx[order], d[order]
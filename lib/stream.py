@@ -0,0 +1,241 @@
+import numpy as np
+from copy import copy
+from typing import Callable
+from lib.topology import Topology, Pylon, Wlambert, link_budget
+from lib.spatial import GridIndex
+
+
+class StackedPylons:
+    """Pylons mapping of a topology view holding a single pylon with array coordinates and heights.
+
+    The path loss models look their pylon up in `topo.pylons` and only use numpy
+    operations on its position and height, so they evaluate the links of many pylons
+    to one UE at once with such a view.
+    """
+
+    def __init__(self, pylon:Pylon):
+        self.pylon = pylon
+
+    def __getitem__(self, p:tuple[np.ndarray,np.ndarray]) -> Pylon:
+        return self.pylon
+
+
+class StreamingAllocator:
+    """Online allocation of UEs arriving, moving and leaving one update at a time.
+
+    The pylons sit in a `GridIndex` with cells of the antenna reach, so an update
+    only looks at the pylons of the cells around the UE and pylons can be added or
+    removed while streaming. The remaining bandwidth and height of every pylon are
+    kept in arrays indexed by its grid slot. The bandwidth a pylon has to allocate to
+    a UE is the one of `compute_W_allocation` (SNR, no interference): the link budgets
+    of all the candidate pylons are computed at once (`link_budgets`) and solved in
+    closed form (`Wlambert`). A UE keeps its pylon while it is in reach and still
+    fits, otherwise it is handed over to the candidate needing the least bandwidth,
+    so the cost of an update only depends on the density of pylons around the UE.
+    """
+
+    topo:Topology
+    """Topology holding the pylons and antenna models."""
+    model:int
+    """Antenna model id used by every pylon."""
+    pylons:GridIndex
+    """Spatial index of the pylons, keyed by their position."""
+    remaining:np.ndarray
+    """Remaining bandwidth of each pylon slot in Hz."""
+    heights:np.ndarray
+    """Height of each pylon slot in meters."""
+    users:dict[object, tuple[tuple[float,float], float, int, float]]
+    """Position, demand, pylon slot (-1 if unserved) and allocated bandwidth of each UE id."""
+    handovers:int
+    """Number of UEs moved from a pylon to another one so far."""
+
+    def __init__(self, topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], model:int=0):
+        """Constructor of the StreamingAllocator class, indexes the pylons of the topology.
+
+        Parameters
+        ----------
+        topo
+            Topology object, its pylons are set to use the model.
+        pathloss
+            Path loss model to use.
+        model
+            Antenna model id used by every pylon.
+        """
+        self.topo = topo
+        self.pathloss = pathloss
+        self.model = model
+        self.reach = topo.antennas[model].reach
+        self.capacity = topo.antennas[model].bandwidth
+        self.pylons = GridIndex(self.reach)
+        self.remaining = np.zeros(0)
+        self.heights = np.zeros(0)
+        self.users = {}
+        self.handovers = 0
+        for p, pylon in topo.pylons.items():
+            self.add_pylon(p, pylon.height)
+
+    def _assign(self, key:object, u:tuple[float,float], demand:float, current:int, W:float) -> dict[str,object]:
+        """Assign a UE to a pylon, keeping its current one if it still fits."""
+        if current >= 0:
+            self.remaining[current] += W
+        slots, _ = self.pylons.query(u, self.reach)
+        chosen, allocated = -1, 0.
+        if len(slots):
+            S = self.link_budgets(slots, u)
+            Ws = Wlambert(demand, -174, S)
+            fits = Ws <= self.remaining[slots]
+            if current >= 0 and fits[slots == current].any():
+                chosen = current
+            elif fits.any():
+                chosen = int(slots[fits][np.argmin(Ws[fits])])
+            if chosen >= 0:
+                allocated = float(Ws[slots == chosen][0])
+                self.remaining[chosen] -= allocated
+
+        handover = current >= 0 and chosen != current
+        self.handovers += handover
+        self.users[key] = (u, demand, chosen, allocated)
+        return {
+            "id": key,
+            "pylon": None if chosen < 0 else list(self.pylons.keys[chosen]),
+            "bandwidth": allocated,
+            "handover": handover
+        }
+
+    def link_budgets(self, slots:np.ndarray, u:tuple[float,float]) -> np.ndarray:
+        """Received signal power at a UE from some pylons, all computed at once.
+
+        Parameters
+        ----------
+        slots
+            Slots of the pylons.
+        u
+            Position of the UE.
+
+        Returns
+        -------
+        Received signal power in dBm from each pylon.
+        """
+        pos = self.pylons.pos[slots]
+        p = (pos[:,0], pos[:,1])
+        view = copy(self.topo)
+        view.pylons = StackedPylons(Pylon(p, self.heights[slots], self.model))
+        return np.broadcast_to(link_budget(view, p, u, self.pathloss), slots.shape)
+
+    def update(self, key:object, u:tuple[float,float], demand:float|None=None) -> dict[str,object]:
+        """Add a UE or move it, assigning or handing it over.
+
+        Parameters
+        ----------
+        key
+            Id of the UE.
+        u
+            New position of the UE.
+        demand
+            Demand of the UE in bits per second, defaults to its previous demand.
+
+        Returns
+        -------
+        Event with the UE `id`, its `pylon` (None if unserved), its allocated `bandwidth` and whether it was handed over.
+        """
+        if key in self.users:
+            _, previous, current, W = self.users[key]
+        else:
+            previous, current, W = None, -1, 0.
+        if demand is None:
+            if previous is None:
+                raise ValueError(f"Missing demand of the new UE {key}")
+            demand = previous
+        return self._assign(key, (float(u[0]), float(u[1])), float(demand), current, W)
+
+    def leave(self, key:object) -> dict[str,object]:
+        """Remove a UE, giving its bandwidth back to its pylon.
+
+        Parameters
+        ----------
+        key
+            Id of the UE.
+
+        Returns
+        -------
+        Event of the UE without pylon.
+        """
+        _, _, current, W = self.users.pop(key)
+        if current >= 0:
+            self.remaining[current] += W
+        return {"id": key, "pylon": None, "bandwidth": 0., "handover": False}
+
+    def add_pylon(self, p:tuple[float,float], height:float) -> None:
+        """Add a pylon using the model, the UEs only use it from their next update.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+        height
+            Height of the pylon in meters.
+        """
+        if p not in self.topo.pylons:
+            self.topo.pylons[p] = Pylon(p, height, self.model)
+        self.topo.pylons[p].antenna_type = self.model
+        i = self.pylons.add(p, p)
+        if i >= len(self.remaining):
+            self.remaining = np.concatenate((self.remaining, np.zeros(len(self.pylons.pos) - len(self.remaining))))
+            self.heights = np.concatenate((self.heights, np.zeros(len(self.pylons.pos) - len(self.heights))))
+        self.remaining[i] = self.capacity
+        self.heights[i] = self.topo.pylons[p].height
+
+    def remove_pylon(self, p:tuple[float,float]) -> list[dict[str,object]]:
+        """Remove a pylon and reassign its UEs.
+
+        Parameters
+        ----------
+        p
+            Position of the pylon.
+
+        Returns
+        -------
+        Events of the reassigned UEs.
+        """
+        i = self.pylons.remove(p)
+        del self.topo.pylons[p]
+        self.remaining[i] = 0.
+        events = []
+        for key, (u, demand, current, _) in list(self.users.items()):
+            if current == i:
+                event = self._assign(key, u, demand, -1, 0.)
+                event["handover"] = event["pylon"] is not None
+                self.handovers += event["handover"]
+                events.append(event)
+        return events
+
+    def handle(self, message:dict[str,object]) -> list[dict[str,object]]:
+        """Apply a stream message.
+
+        The messages are `{"id": ..., "x": ..., "y": ..., "demand": ...}` to add or move
+        a UE (`demand` is optional for known UEs), `{"id": ..., "leave": true}` to remove
+        it, `{"pylon": {"x": ..., "y": ..., "h": ...}}` to add a pylon and
+        `{"pylon": {"x": ..., "y": ...}, "remove": true}` to remove it.
+
+        Parameters
+        ----------
+        message
+            Decoded JSON message.
+
+        Returns
+        -------
+        Events of the UEs whose assignment was computed.
+        """
+        if "pylon" in message:
+            p = (message["pylon"]["x"], message["pylon"]["y"])
+            if message.get("remove", False):
+                return self.remove_pylon(p)
+            self.add_pylon(p, message["pylon"]["h"])
+            return []
+        if message.get("leave", False):
+            return [self.leave(message["id"])]
+        return [self.update(message["id"], (message["x"], message["y"]), message.get("demand"))]
+
+    def served(self) -> int:
+        """Number of UEs currently served."""
+        return sum(1 for _, _, current, _ in self.users.values() if current >= 0)
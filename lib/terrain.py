@@ -0,0 +1,214 @@
+import json
+import numpy as np
+from os.path import dirname, join, basename, splitext
+
+
+class Terrain:
+    """Surface height raster (ground elevation plus buildings) stored as a memory-mapped array.
+
+    Only the pages of the raster holding the sampled cells are read from the disk,
+    so city-scale rasters can be used without loading them into memory. Row `i` and
+    column `j` of the raster cover the square of the topology coordinates starting
+    at `origin + (j, i) * resolution`.
+    """
+
+    heights:np.ndarray
+    """(rows, columns) surface heights in meters, rows going along the y axis."""
+    origin:tuple[float,float]
+    """(x,y) position of the lower left corner of the raster in meters."""
+    resolution:float
+    """Size of a raster cell in meters."""
+
+    def __init__(self, heights:np.ndarray, origin:tuple[float,float]=(0., 0.), resolution:float=1.):
+        """Constructor of the Terrain class.
+
+        Parameters
+        ----------
+        heights
+            (rows, columns) surface heights in meters, usually a `np.memmap`.
+        origin
+            (x,y) position of the lower left corner of the raster in meters.
+        resolution
+            Size of a raster cell in meters.
+        """
+        self.heights = heights
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.resolution = float(resolution)
+
+    @classmethod
+    def load(cls, filename:str) -> "Terrain":
+        """Open a terrain description JSON file, its raster is memory-mapped and not read.
+
+        Parameters
+        ----------
+        filename
+            JSON file written by `save`, with the `raster` .npy file (relative to the JSON file), its `origin` and `resolution`.
+
+        Returns
+        -------
+        Terrain object.
+        """
+        description = json.load(open(filename, "r"))
+        heights = np.load(join(dirname(filename), description["raster"]), mmap_mode="r")
+        return cls(heights, tuple(description["origin"]), description["resolution"])
+
+    def save(self, filename:str) -> None:
+        """Write the terrain description JSON file next to its .npy raster.
+
+        Parameters
+        ----------
+        filename
+            JSON file to write, the raster must already be saved as the .npy file of the same name.
+        """
+        with open(filename, "w") as f:
+            json.dump({
+                "raster": splitext(basename(filename))[0] + ".npy",
+                "origin": list(self.origin),
+                "resolution": self.resolution
+            }, f, indent=4)
+
+    def sample(self, xs:np.ndarray, ys:np.ndarray) -> np.ndarray:
+        """Vectorized surface height at some positions (nearest cell), 0 out of the raster.
+
+        Parameters
+        ----------
+        xs
+            X positions in meters.
+        ys
+            Y positions in meters.
+
+        Returns
+        -------
+        Surface heights in meters, with the shape of `xs`.
+        """
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+        cols = np.floor((xs - self.origin[0]) / self.resolution).astype(np.intp)
+        rows = np.floor((ys - self.origin[1]) / self.resolution).astype(np.intp)
+        inside = (rows >= 0) & (rows < self.heights.shape[0]) & (cols >= 0) & (cols < self.heights.shape[1])
+        out = np.zeros(xs.shape)
+        # Only the cells actually sampled are read from the memory map
+        out[inside] = self.heights[rows[inside], cols[inside]]
+        return out
+
+    def profile(self, p:tuple[float,float], xs:np.ndarray, ys:np.ndarray, samples:int=32) -> np.ndarray:
+        """Surface heights along the links from a point to many positions, all sampled at once.
+
+        Parameters
+        ----------
+        p
+            Start of the links, or tuple of x and y coordinates arrays of the start of each link.
+        xs
+            X positions of the ends of the links.
+        ys
+            Y positions of the ends of the links.
+        samples
+            Number of points sampled inside each link, evenly spaced and excluding its ends.
+
+        Returns
+        -------
+        (links, samples) surface heights, sample `k` being at the fraction `(k+1) / (samples+1)` of the link.
+        """
+        t = np.arange(1, samples+1) / (samples+1)
+        xs = np.asarray(xs, dtype=float).reshape(-1, 1)
+        ys = np.asarray(ys, dtype=float).reshape(-1, 1)
+        px = np.asarray(p[0], dtype=float).reshape(-1, 1)
+        py = np.asarray(p[1], dtype=float).reshape(-1, 1)
+        return self.sample(px + (xs - px) * t, py + (ys - py) * t)
+
+
+def synthetic_terrain(out_file:str, shape:tuple[int,int], resolution:float=5., origin:tuple[float,float]=(0., 0.), hills:int=20, buildings:int=2000, seed:int|None=None, block_rows:int=512) -> Terrain:
+    """Generate a random terrain with hills and buildings, written block by block to a memory-mapped raster.
+
+    Parameters
+    ----------
+    out_file
+        .npy raster file to write.
+    shape
+        (rows, columns) of the raster.
+    resolution
+        Size of a raster cell in meters.
+    origin
+        (x,y) position of the lower left corner of the raster in meters.
+    hills
+        Number of gaussian hills.
+    buildings
+        Number of rectangular buildings.
+    seed
+        Random seed.
+    block_rows
+        Number of raster rows generated at once, bounds the memory used.
+
+    Returns
+    -------
+    Terrain on the written raster.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    heights = np.lib.format.open_memmap(out_file, mode="w+", dtype=np.float32, shape=shape)
+
+    # Hills: centers, widths and heights in raster cells and meters
+    centers = rng.uniform((0, 0), (rows, cols), (hills, 2))
+    widths = rng.uniform(.05, .2, hills) * max(rows, cols)
+    tops = rng.uniform(10, 120, hills)
+    # Buildings: lower left corner, size in cells and height in meters
+    corners = rng.integers((0, 0), (rows, cols), (buildings, 2))
+    sizes = rng.integers(2, max(3, int(40 / resolution)), (buildings, 2))
+    levels = rng.uniform(5, 50, buildings)
+
+    x = np.arange(cols)
+    for start in range(0, rows, block_rows):
+        end = min(start + block_rows, rows)
+        y = np.arange(start, end).reshape(-1, 1)
+        block = np.zeros((end - start, cols), dtype=np.float32)
+        for (cy, cx), w, top in zip(centers, widths, tops):
+            block += (top * np.exp(-((y - cy)**2 + (x - cx)**2) / (2 * w * w))).astype(np.float32)
+        # Only the buildings crossing the block are stamped
+        crossing = (corners[:,0] < end) & (corners[:,0] + sizes[:,0] > start)
+        for (r, c), (h, w), level in zip(corners[crossing], sizes[crossing], levels[crossing]):
+            r0, r1 = max(r, start) - start, min(r + h, end) - start
+            block[r0:r1, c:c+w] += level
+        heights[start:end] = block
+    heights.flush()
+    return Terrain(np.load(out_file, mmap_mode="r"), origin, resolution)
+
+
+def convert_ascii_grid(in_file:str, out_file:str, origin:tuple[float,float]|None=None) -> Terrain:
+    """Convert an ESRI ASCII grid (.asc, the format of most DEM tiles) into a memory-mapped raster, row by row.
+
+    Parameters
+    ----------
+    in_file
+        ASCII grid file to read.
+    out_file
+        .npy raster file to write.
+    origin
+        (x,y) position of the lower left corner of the grid in the topology coordinates,
+        defaults to the `xllcorner` and `yllcorner` of the grid.
+
+    Returns
+    -------
+    Terrain on the written raster.
+    """
+    with open(in_file, "r") as f:
+        # Header lines ("ncols 1000", "cellsize 5"...) until the first row of values
+        header = {}
+        while True:
+            position = f.tell()
+            line = f.readline().split()
+            if not line or not line[0][0].isalpha():
+                f.seek(position)
+                break
+            header[line[0].lower()] = float(line[1])
+        rows, cols = int(header["nrows"]), int(header["ncols"])
+        nodata = header.get("nodata_value")
+        heights = np.lib.format.open_memmap(out_file, mode="w+", dtype=np.float32, shape=(rows, cols))
+        # The grid starts with its northernmost row while the raster rows go along the y axis
+        for i in range(rows):
+            row = np.array(f.readline().split(), dtype=np.float32)
+            if nodata is not None:
+                row[row == nodata] = 0.
+            heights[rows - 1 - i] = row
+        heights.flush()
+    if origin is None:
+        origin = (header.get("xllcorner", 0.), header.get("yllcorner", 0.))
+    return Terrain(np.load(out_file, mmap_mode="r"), origin, header["cellsize"])
@@ -0,0 +1,330 @@
+import json
+import numpy as np
+from os import makedirs
+from os.path import join
+from typing import Callable
+from lib.topology import Topology, AntennaModel, Pylon, Wsolve, link_budget
+from lib.kernels import admit_prefix
+from lib.progress import Progress
+from lib.writer import write_log
+
+
+ue_columns:tuple[str,...] = ("x", "y", "demand")
+"""Columns of the on-disk UE arrays."""
+tower_columns:tuple[str,...] = ("x", "y", "h")
+"""Columns of the on-disk tower arrays."""
+
+ue_bytes:int = 160
+"""Upper bound of the memory used per resident UE in bytes: its columns, results, copies while loading them and spatial index entry."""
+edge_bytes:int = 128
+"""Upper bound of the memory used per edge of the tower being allocated in bytes: query result, distances, order and sorted copies."""
+solve_bytes:int = 256
+"""Upper bound of the memory used per link being solved in bytes: link budgets, bandwidths and bisection temporaries."""
+max_chunk:int = 65536
+"""Maximum number of links solved at once, bounds the memory of the solver."""
+
+
+def json_to_array(items:list[object], columns:tuple[str,...], out_file:str) -> np.ndarray:
+    """Write loaded equipments or towers JSON items as an on-disk (items, columns) array.
+
+    Parameters
+    ----------
+    items
+        JSON loaded array of UEs or towers.
+    columns
+        Columns to write, `ue_columns` or `tower_columns`.
+    out_file
+        .npy file to write.
+
+    Returns
+    -------
+    Memory-mapped array.
+    """
+    array = np.lib.format.open_memmap(out_file, mode="w+", dtype=float, shape=(len(items), len(columns)))
+    for i, item in enumerate(items):
+        array[i] = [ item[c] if c in item else item["pos"][c] for c in columns ]
+    array.flush()
+    return np.load(out_file, mmap_mode="r")
+
+
+class TileGrid:
+    """Square tiles covering the region, numbered row by row."""
+
+    origin:tuple[float,float]
+    """(x,y) position of the lower left corner of the first tile in meters."""
+    tile:float
+    """Size of a tile in meters."""
+    shape:tuple[int,int]
+    """(rows, columns) number of tiles."""
+
+    def __init__(self, origin:tuple[float,float], tile:float, shape:tuple[int,int]):
+        self.origin = origin
+        self.tile = float(tile)
+        self.shape = shape
+
+    @classmethod
+    def covering(cls, arrays:list[np.ndarray], tile:float, block:int) -> "TileGrid":
+        """Smallest grid covering the positions of some on-disk arrays, read block by block."""
+        lo, hi = np.full(2, np.inf), np.full(2, -np.inf)
+        for array in arrays:
+            for start in range(0, len(array), block):
+                pos = np.asarray(array[start:start+block, :2])
+                lo, hi = np.minimum(lo, pos.min(axis=0)), np.maximum(hi, pos.max(axis=0))
+        if not np.isfinite(lo).all():
+            lo, hi = np.zeros(2), np.zeros(2)
+        cols, rows = (np.floor((hi - lo) / tile) + 1).astype(int)
+        return cls((float(lo[0]), float(lo[1])), tile, (int(rows), int(cols)))
+
+    def __len__(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    def index(self, pos:np.ndarray) -> np.ndarray:
+        """Tile of each (x,y) position, clipped to the grid."""
+        cols = np.clip(np.floor((pos[:,0] - self.origin[0]) / self.tile).astype(np.intp), 0, self.shape[1]-1)
+        rows = np.clip(np.floor((pos[:,1] - self.origin[1]) / self.tile).astype(np.intp), 0, self.shape[0]-1)
+        return rows * self.shape[1] + cols
+
+    def halo(self, k:int, rings:int) -> list[tuple[int,int]]:
+        """Tile ranges `[start, end)` of the tiles within some rings around a tile, one range per row of tiles."""
+        row, col = divmod(k, self.shape[1])
+        c0, c1 = max(col - rings, 0), min(col + rings, self.shape[1] - 1)
+        return [ (r * self.shape[1] + c0, r * self.shape[1] + c1 + 1) for r in range(max(row - rings, 0), min(row + rings, self.shape[0] - 1) + 1) ]
+
+
+def sort_by_tile(array:np.ndarray, grid:TileGrid, out_file:str, index_file:str, block:int) -> np.ndarray:
+    """Counting sort of an on-disk array by tile, reading and writing it block by block.
+
+    Parameters
+    ----------
+    array
+        (items, columns) array whose first columns are the x and y positions.
+    grid
+        Tiles to sort by.
+    out_file
+        .npy file of the sorted array.
+    index_file
+        .npy file of the row of `array` of each sorted row.
+    block
+        Number of rows read at once.
+
+    Returns
+    -------
+    Start row of each tile in the sorted array, and the total number of rows at the end.
+    """
+    counts = np.zeros(len(grid), dtype=np.intp)
+    for start in range(0, len(array), block):
+        counts += np.bincount(grid.index(np.asarray(array[start:start+block])), minlength=len(grid))
+    ptr = np.zeros(len(grid)+1, dtype=np.intp)
+    np.cumsum(counts, out=ptr[1:])
+
+    out = np.lib.format.open_memmap(out_file, mode="w+", dtype=array.dtype, shape=array.shape)
+    index = np.lib.format.open_memmap(index_file, mode="w+", dtype=np.intp, shape=(len(array),))
+    # Next free row of each tile
+    cursor = ptr[:-1].copy()
+    for start in range(0, len(array), block):
+        rows = np.asarray(array[start:start+block])
+        tiles = grid.index(rows)
+        order = np.argsort(tiles, kind='stable')
+        tiles = tiles[order]
+        # Rank of each row among the rows of its tile in the block
+        first = np.searchsorted(tiles, tiles)
+        target = cursor[tiles] + np.arange(len(tiles)) - first
+        out[target] = rows[order]
+        index[target] = start + order
+        cursor += np.bincount(tiles, minlength=len(grid))
+    out.flush()
+    index.flush()
+    return ptr
+
+
+def tiled_allocation(users:np.ndarray, towers:np.ndarray, antennas:list[object], pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], out_folder:str, model:int=0, tile:float=10e3, memory:float=1024e6, verbose:bool=False) -> dict[str,object]:
+    """Out-of-core greedy allocation, the region being streamed tile by tile from on-disk arrays.
+
+    The UEs and towers are first sorted by tile on the disk, so that the UEs of a
+    row of tiles are contiguous. Each tile then only loads its UEs and the ones of
+    the tiles within the reach of the model (its halo) and runs the greedy on its
+    own towers: by decreasing QoS density, each tower serving its unserved UEs by
+    increasing distance until one doesn't fit. The edges of a tower are queried when
+    it is reached and its bandwidths are solved by growing chunks, so only the edges
+    of a single tower are resident at once. The assignment of the UEs is kept in
+    memory-mapped arrays on the disk, so that the UEs served by a tower of a tile are
+    seen as served by the next tiles, and the tower results of each tile are spilled
+    to their own file. Both are merged back into the input order at the end.
+
+    Parameters
+    ----------
+    users
+        (UEs, 3) x, y and demand of the UEs, usually memory-mapped.
+    towers
+        (towers, 3) x, y and height of the towers, usually memory-mapped.
+    antennas
+        JSON loaded array of antenna models.
+    pathloss
+        Path loss model to use.
+    out_folder
+        Folder of the sorted arrays, tile results and merged results.
+    model
+        Antenna model id used by every tower.
+    tile
+        Size of a tile in meters.
+    memory
+        Memory ceiling of the arrays resident at once in bytes (the interpreter and libraries excluded).
+        A `MemoryError` is raised before the allocation starts if a tile and its halo can't fit,
+        and before loading the edges of a tower if they can't fit with its tile.
+    verbose
+        Print the progress of the tiles.
+
+    Returns
+    -------
+    Summary of the allocation: numbers of UEs, served UEs, towers, used towers and tiles, and the result files.
+    """
+    makedirs(join(out_folder, "tiles"), exist_ok=True)
+    # The passes over the input arrays read blocks of half the ceiling, their rows and sort keys taking less than `ue_bytes`
+    block = max(int(memory / 2 / ue_bytes), 1024)
+
+    # Topology holding the antenna models and, tile by tile, the towers of the tile
+    topo = Topology()
+    topo.antennas = [ AntennaModel(a["name"], a["power"], a["gain"], a["bandwidth"], a["frequency"], a["range"], a.get("fov", 360)) for a in antennas ]
+    reach = topo.antennas[model].reach
+    capacity = topo.antennas[model].bandwidth
+
+    grid = TileGrid.covering([users, towers], tile, block)
+    users_ptr = sort_by_tile(users, grid, join(out_folder, "users_sorted.npy"), join(out_folder, "users_index.npy"), block)
+    towers_ptr = sort_by_tile(towers, grid, join(out_folder, "towers_sorted.npy"), join(out_folder, "towers_index.npy"), block)
+    sorted_users = np.load(join(out_folder, "users_sorted.npy"), mmap_mode="r")
+    sorted_towers = np.load(join(out_folder, "towers_sorted.npy"), mmap_mode="r")
+    towers_index = np.load(join(out_folder, "towers_index.npy"), mmap_mode="r")
+
+    # Check the ceiling against the largest halo before starting, with room for the edges and links of a tower
+    rings = int(np.ceil(reach / tile))
+    resident = [ sum(users_ptr[b] - users_ptr[a] for a,b in grid.halo(k, rings)) if towers_ptr[k+1] > towers_ptr[k] else 0 for k in range(len(grid)) ]
+    largest = int(np.argmax(resident)) if resident else 0
+    chunk_memory = min(max_chunk, resident[largest] if resident else 0) * solve_bytes
+    if resident and resident[largest] * ue_bytes + chunk_memory > memory:
+        raise MemoryError(
+            f"Tile {largest} and its halo hold {resident[largest]} UEs (~{(resident[largest] * ue_bytes + chunk_memory) / 1e6:.0f} MB), "
+            f"above the {memory / 1e6:.0f} MB ceiling: use smaller tiles or a higher ceiling"
+        )
+
+    # Assignment of the sorted UEs (sorted tower row, -1 if unserved) and their bandwidth, kept on the disk
+    assigned = np.lib.format.open_memmap(join(out_folder, "users_tower_sorted.npy"), mode="w+", dtype=np.intp, shape=(len(users),))
+    bandwidth = np.lib.format.open_memmap(join(out_folder, "users_bandwidth_sorted.npy"), mode="w+", dtype=float, shape=(len(users),))
+    for start in range(0, len(users), block):
+        assigned[start:start+block] = -1
+        bandwidth[start:start+block] = 0.
+
+    from scipy.spatial import cKDTree # Imported on first use to keep the library import fast
+
+    tiles_done = 0
+    progress = Progress("Allocating tiles", len(grid), enabled=verbose)
+    for k in range(len(grid)):
+        t0, t1 = towers_ptr[k], towers_ptr[k+1]
+        if t0 == t1:
+            progress.update()
+            continue
+
+        # Resident UEs: the tile and its halo, one contiguous slice per row of tiles
+        slices = [ (users_ptr[a], users_ptr[b]) for a,b in grid.halo(k, rings) ]
+        rows = np.concatenate([ np.arange(a, b) for a,b in slices ])
+        data = np.concatenate([ np.asarray(sorted_users[a:b]) for a,b in slices ])
+        pos, demand = data[:,:2], data[:,2]
+        tile_assigned = np.concatenate([ np.asarray(assigned[a:b]) for a,b in slices ])
+        tile_bandwidth = np.zeros(len(rows))
+
+        # The towers of the tile only, with the model
+        tile_towers = [ (float(x), float(y)) for x,y,_ in np.asarray(sorted_towers[t0:t1]).tolist() ]
+        topo.pylons = { p: Pylon(p, float(h), model) for p,h in zip(tile_towers, np.asarray(sorted_towers[t0:t1, 2]).tolist()) }
+        # Unbalanced trees are built faster and are only queried a few times per tower
+        tree = cKDTree(pos, balanced_tree=False, compact_nodes=False)
+        base = len(rows) * ue_bytes + min(max_chunk, len(rows)) * solve_bytes
+
+        def tower_edges(j:int, sort:bool=True) -> tuple[np.ndarray, np.ndarray]:
+            """Edges of a tower of the tile (by increasing distance if sorted), within the ceiling."""
+            p = tile_towers[j]
+            n_edges = int(tree.query_ball_point(p, reach, return_length=True))
+            if base + n_edges * edge_bytes > memory:
+                raise MemoryError(
+                    f"Tower {p} has {n_edges} UEs in reach (~{(base + n_edges * edge_bytes) / 1e6:.0f} MB with its tile), "
+                    f"above the {memory / 1e6:.0f} MB ceiling: use smaller tiles or a higher ceiling"
+                )
+            idx = np.array(tree.query_ball_point(p, reach), dtype=np.intp)
+            d = np.hypot(pos[idx,0] - p[0], pos[idx,1] - p[1])
+            if not sort:
+                return idx, d
+            order = np.argsort(d, kind='stable')
+            return idx[order], d[order]
+
+        # QoS density of each tower, one tower at a time
+        densities = np.zeros(t1 - t0)
+        for j in range(t1 - t0):
+            idx, d = tower_edges(j, sort=False)
+            if len(idx):
+                with np.errstate(divide="ignore"):
+                    densities[j] = np.mean(demand[idx] / d)
+
+        # Greedy in the QoS density order of the towers of the tile
+        used = np.zeros(t1 - t0)
+        served = np.zeros(t1 - t0, dtype=np.intp)
+        for j in np.argsort(-densities, kind='stable').tolist():
+            idx, _ = tower_edges(j)
+            idx = idx[tile_assigned[idx] == -1]
+            # The bandwidths are solved by growing chunks until the tower is full
+            start, size = 0, 256
+            while start < len(idx):
+                chunk = idx[start:start+size]
+                w = Wsolve(demand[chunk], -174, link_budget(topo, tile_towers[j], (pos[chunk,0], pos[chunk,1]), pathloss))
+                n = admit_prefix(w, capacity - used[j])
+                tile_assigned[chunk[:n]] = t0 + j
+                tile_bandwidth[chunk[:n]] = w[:n]
+                used[j] += w[:n].sum()
+                served[j] += n
+                if n < len(chunk):
+                    break
+                start, size = start + size, min(2 * size, max_chunk)
+
+        # Spill the results: UE assignments in place, tower results of the tile in their own file
+        # The UEs served here are the ones assigned to a tower of the tile, whatever their bandwidth
+        changed = (tile_assigned >= t0) & (tile_assigned < t1)
+        assigned[rows[changed]] = tile_assigned[changed]
+        bandwidth[rows[changed]] = tile_bandwidth[changed]
+        np.savez(join(out_folder, "tiles", f"{k}.npz"), towers=np.arange(t0, t1), served=served, used=used)
+        tiles_done += 1
+        progress.update()
+    progress.close()
+    assigned.flush()
+    bandwidth.flush()
+
+    # Merge the results back into the input order
+    users_index = np.load(join(out_folder, "users_index.npy"), mmap_mode="r")
+    user_tower = np.lib.format.open_memmap(join(out_folder, "users_tower.npy"), mode="w+", dtype=np.intp, shape=(len(users),))
+    user_bandwidth = np.lib.format.open_memmap(join(out_folder, "users_bandwidth.npy"), mode="w+", dtype=float, shape=(len(users),))
+    n_served = 0
+    for start in range(0, len(users), block):
+        a = np.asarray(assigned[start:start+block])
+        user_tower[users_index[start:start+block]] = np.where(a >= 0, towers_index[np.maximum(a, 0)], -1)
+        user_bandwidth[users_index[start:start+block]] = bandwidth[start:start+block]
+        n_served += int(np.count_nonzero(a >= 0))
+    user_tower.flush()
+    user_bandwidth.flush()
+
+    tower_served = np.zeros(len(towers), dtype=np.intp)
+    tower_used = np.zeros(len(towers))
+    for k in range(len(grid)):
+        if towers_ptr[k+1] > towers_ptr[k]:
+            with np.load(join(out_folder, "tiles", f"{k}.npz")) as result:
+                original = towers_index[result["towers"]]
+                tower_served[original] = result["served"]
+                tower_used[original] = result["used"]
+    np.savez(join(out_folder, "towers.npz"), served=tower_served, used_bandwidth=tower_used, total_bandwidth=np.full(len(towers), capacity))
+
+    summary = {
+        "users": len(users),
+        "served_users": n_served,
+        "towers": len(towers),
+        "used_towers": int(np.count_nonzero(tower_served)),
+        "tiles": tiles_done,
+        "largest_halo": int(resident[largest]) if resident else 0,
+        "results": [ join(out_folder, f) for f in ("users_tower.npy", "users_bandwidth.npy", "towers.npz") ]
+    }
+    write_log(f"Tiled allocation: {json.dumps(summary)}")
+    return summary
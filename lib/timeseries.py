@@ -0,0 +1,221 @@
+import numpy as np
+from typing import Callable
+from lib.topology import Topology, Wsolve, link_budget
+from lib.kernels import admit_prefix
+from lib.priority import DensityQueue
+from lib.progress import Progress
+from lib.writer import write_log
+
+
+daily_profile:np.ndarray = np.array([
+    .35, .25, .2, .18, .2, .3, .5, .75, .9, .85, .8, .85,
+    .95, .9, .85, .85, .9, 1., 1., .95, .9, .8, .65, .5
+])
+"""Relative hourly demand of a typical day, peaking in the evening."""
+
+
+def demand_matrix(topo:Topology, profile:np.ndarray=daily_profile, jitter:float=0., seed:int|None=None) -> np.ndarray:
+    """Demand of each UE at each time step, its static demand scaled by a profile.
+
+    Parameters
+    ----------
+    topo
+        Topology object, its edges must be built.
+    profile
+        Relative demand at each time step.
+    jitter
+        Standard deviation of a lognormal noise applied to each demand, 0 for none.
+    seed
+        Random seed of the noise.
+
+    Returns
+    -------
+    (UEs, time steps) demands in bits per second, the UEs following `topo.edge_store.users`.
+    """
+    demand = np.array([ topo.users[u].demand for u in topo.edge_store.users.keys ], dtype=float)
+    matrix = np.outer(demand, profile)
+    if jitter > 0:
+        matrix *= np.random.default_rng(seed).lognormal(0., jitter, matrix.shape)
+    return matrix
+
+
+class EdgeBandwidths:
+    """Bandwidth of the edges of each pylon at every time step, solved on demand.
+
+    The link budgets of all the edges are computed once. The bandwidths of an edge
+    are solved for all the time steps at once, but only when an allocation needs it:
+    a pylon saturates after its first few unserved UEs, so most edges are never solved.
+    """
+
+    users:list[np.ndarray]
+    """UE indices of the edges of each pylon, sorted by distance."""
+    budgets:list[np.ndarray]
+    """Link budget of the edges of each pylon in dBm."""
+    solved:int
+    """Number of edges solved so far."""
+
+    def __init__(self, topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], demand:np.ndarray, model:int):
+        """Constructor of the EdgeBandwidths class, computes the link budgets.
+
+        Parameters
+        ----------
+        topo
+            Topology object with its edges built, every pylon is set to use the model.
+        pathloss
+            Path loss model to use.
+        demand
+            (UEs, time steps) demands in bits per second.
+        model
+            Antenna model id used by every pylon.
+        """
+        store = topo.edge_store
+        self.demand = demand
+        self.users, self.budgets = [], []
+        for p in store.pylons:
+            topo.pylons[p].antenna_type = model
+            users, _ = store.edges(p, model)
+            pos = store.users.pos[users]
+            self.users.append(users)
+            self.budgets.append(link_budget(topo, p, (pos[:,0], pos[:,1]), pathloss))
+        self.solved = 0
+        # Bandwidths of the edges of a pylon, allocated when its first edge is solved (NaN while unsolved)
+        self._W = [None] * len(self.users)
+
+    def get(self, i:int, edges:np.ndarray) -> np.ndarray:
+        """Bandwidths of some edges of a pylon at every time step, solving the missing ones.
+
+        Parameters
+        ----------
+        i
+            Pylon index.
+        edges
+            Positions of the edges in the edges of the pylon.
+
+        Returns
+        -------
+        (edges, time steps) bandwidths in Hz, `np.inf` where the demand can't be met.
+        """
+        if self._W[i] is None:
+            self._W[i] = np.full((len(self.users[i]), self.demand.shape[1]), np.nan)
+        W = self._W[i]
+        missing = edges[np.isnan(W[edges,0])]
+        if len(missing):
+            W[missing] = Wsolve(self.demand[self.users[i][missing]], -174, self.budgets[i][missing].reshape(-1, 1))
+            self.solved += len(missing)
+        return W[edges]
+
+
+def timeseries_allocation(topo:Topology, pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float], demand:np.ndarray, model:int=0, warm_start:bool=True, verbose:bool=False) -> tuple[np.ndarray, np.ndarray]:
+    """Greedy allocation of pylons to end users at every time step of a demand matrix.
+
+    The edges and their link budgets are computed once and the bandwidths of an edge
+    are solved for every time step at once (see `EdgeBandwidths`). Each step then
+    starts from the assignment of the previous step: the UEs keep their pylon while
+    they still fit in it (closest first), and only the other UEs go through the greedy
+    (pylons by decreasing QoS density, each one serving its unassigned UEs by
+    increasing distance until one doesn't fit), so a step costs little when the
+    demand changes smoothly.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    pathloss
+        Path loss model to use.
+    demand
+        (UEs, time steps) demands in bits per second, the UEs following `topo.edge_store.users`.
+    model
+        Antenna model id used by every pylon.
+    warm_start
+        Start each step from the previous assignment, otherwise every step is allocated from scratch.
+    verbose
+        Print the progress of the time steps.
+
+    Returns
+    -------
+    (UEs, time steps) pylon index (in `topo.edge_store.pylons`) of each UE, -1 if unserved,
+    and bandwidth allocated to each UE in Hz.
+    """
+    if topo.edge_store is None:
+        topo.build_edges()
+    store = topo.edge_store
+    n_users, steps = demand.shape
+    capacity = topo.antennas[model].bandwidth
+    bandwidths = EdgeBandwidths(topo, pathloss, demand, model)
+    # Pylons by decreasing QoS density, computed once for all the edges
+    order = np.argsort(-DensityQueue(topo, model).densities(), kind='stable').tolist()
+
+    assigned = np.full((n_users, steps), -1, dtype=np.intp)
+    allocated = np.zeros((n_users, steps))
+    # Position of the edge of each UE in the edges of its pylon
+    slot = np.zeros(n_users, dtype=np.intp)
+    progress = Progress("Allocating time steps", steps, enabled=verbose)
+    for t in range(steps):
+        pylon = assigned[:,t]
+        remaining = np.full(len(store.pylons), capacity)
+        if warm_start and t > 0:
+            # The UEs stay on their previous pylon while they still fit, closest first
+            previous = assigned[:,t-1]
+            kept = np.flatnonzero(previous >= 0)
+            kept = kept[np.lexsort((slot[kept], previous[kept]))]
+            bounds = np.searchsorted(previous[kept], np.arange(len(store.pylons)+1))
+            for i in np.flatnonzero(np.diff(bounds)).tolist():
+                users = kept[bounds[i]:bounds[i+1]]
+                w = bandwidths.get(i, slot[users])[:,t]
+                n = admit_prefix(w, capacity)
+                pylon[users[:n]] = i
+                allocated[users[:n], t] = w[:n]
+                remaining[i] -= w[:n].sum()
+
+        # Greedy on the UEs left unassigned, their bandwidths are solved by growing chunks until the pylon is full
+        for i in order:
+            free = np.flatnonzero(pylon[bandwidths.users[i]] == -1)
+            start, size = 0, 64
+            while start < len(free):
+                edges = free[start:start+size]
+                w = bandwidths.get(i, edges)[:,t]
+                n = admit_prefix(w, remaining[i])
+                users = bandwidths.users[i][edges[:n]]
+                pylon[users] = i
+                slot[users] = edges[:n]
+                allocated[users, t] = w[:n]
+                remaining[i] -= w[:n].sum()
+                if n < len(edges):
+                    break
+                start, size = start + size, 2 * size
+
+        if t > 0:
+            handovers = np.count_nonzero((assigned[:,t] != assigned[:,t-1]) & (assigned[:,t-1] >= 0))
+            write_log(f"Time step {t}: {np.count_nonzero(pylon >= 0)}/{n_users} UEs served, {handovers} handovers")
+        else:
+            write_log(f"Time step {t}: {np.count_nonzero(pylon >= 0)}/{n_users} UEs served")
+        progress.update()
+    progress.close()
+    write_log(f"Time series allocation: {bandwidths.solved}/{sum(map(len, bandwidths.users))} edges solved")
+    return assigned, allocated
+
+
+def apply_time_step(topo:Topology, assigned:np.ndarray, allocated:np.ndarray, t:int, model:int=0) -> None:
+    """Write the allocation of one time step in the topology.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    assigned
+        Pylon indices returned by `timeseries_allocation`.
+    allocated
+        Bandwidths returned by `timeseries_allocation`.
+    t
+        Time step to write.
+    model
+        Antenna model id used by every pylon.
+    """
+    store = topo.edge_store
+    used = np.bincount(assigned[:,t][assigned[:,t] >= 0], weights=allocated[:,t][assigned[:,t] >= 0], minlength=len(store.pylons))
+    for i,p in enumerate(store.pylons):
+        topo.pylons[p].antenna_type = model
+        topo.graph.vertices[p] = topo.antennas[model].bandwidth - used[i]
+    for j,u in enumerate(store.users.keys):
+        topo.users[u].pylon = store.pylons[assigned[j,t]] if assigned[j,t] >= 0 else None
+        topo.graph.vertices[u] = allocated[j,t] if assigned[j,t] >= 0 else 0.
@@ -1,9 +1,13 @@
 import numpy as np
 import json
-from typing import Callable
+from typing import Callable, TYPE_CHECKING
 from lib.graph import WeightedGraph
+from lib.edges import EdgeStore, LazyEdgeProvider
 from lib.util import sample_users, dist2
+from lib.kernels import solve_bandwidth
 from lib.writer import write_log
+if TYPE_CHECKING:
+    from lib.terrain import Terrain
 
 
 class AntennaModel:
@@ -21,8 +25,10 @@ class AntennaModel:
     """Frequency used by the antenna in Hz."""
     reach: float
     """Reach of the antenna in meters (range is a reserved keyword)."""
+    fov: float
+    """Horizontal field of view of a sector in degrees, 360 for an omnidirectional antenna."""
 
-    def __init__(self, name:str, power:float, gain:float, bandwidth:float, frequency:float, reach:float):
+    def __init__(self, name:str, power:float, gain:float, bandwidth:float, frequency:float, reach:float, fov:float=360):
         """Constructor of the AntennaModel class."""
         self.name = name
         self.power = power
@@ -30,6 +36,12 @@ class AntennaModel:
         self.bandwidth = bandwidth
         self.frequency = frequency
         self.reach = reach
+        self.fov = fov
+
+    @property
+    def sectors(self) -> int:
+        """Number of sectors covering the circle around a pylon, each one with its own bandwidth."""
+        return max(1, round(360 / self.fov))
 
 
 class Pylon:
@@ -41,12 +53,15 @@ class Pylon:
     """Effective height of the pylon in meters."""
     antenna_type:int
     """Index of the antenna model used by the pylon."""
+    sectors:int
+    """Number of sectors of the antenna in use, each one with its own bandwidth pool."""
 
-    def __init__(self, pos:tuple[float,float], height:float, antenna_type:int):
+    def __init__(self, pos:tuple[float,float], height:float, antenna_type:int, sectors:int=1):
         """Constructor of the Pylon class."""
         self.pos = pos
         self.height = height
         self.antenna_type = antenna_type
+        self.sectors = sectors
 
 
 class User:
@@ -58,12 +73,15 @@ class User:
     """(x,y) Position of the pylon associated to the user or None."""
     demand:float
     """Bandwidth demand of the user in Hz."""
+    group:int|None
+    """Index of the group of users a super-UE stands for (see `lib.aggregation`), None for a single user."""
 
-    def __init__(self, pos:tuple[float,float], pylon:tuple[float,float]|None, demand:float):
+    def __init__(self, pos:tuple[float,float], pylon:tuple[float,float]|None, demand:float, group:int|None=None):
         """Constructor of the User class."""
         self.pos = pos
         self.pylon = pylon
         self.demand = demand
+        self.group = group
 
 
 class Topology:
@@ -88,6 +106,10 @@ class Topology:
     """Pylons position and their associated Pylon."""
     antennas:list[AntennaModel]
     """List of available antennas models."""
+    edge_store:EdgeStore|LazyEdgeProvider|None
+    """Pylons to UEs edges within the reach of each antenna model, None if not built yet."""
+    terrain:"Terrain|None"
+    """Surface height raster used by the terrain aware path loss models, None for a flat ground."""
 
     def __init__(self, topo_filename:str="", antennas_filename:str=""):
         """Loads a json topology file into a Topology object.
@@ -112,6 +134,8 @@ class Topology:
             self.users = {}
             self.pylons = {}
             self.antennas = []
+            self.edge_store = None
+            self.terrain = None
             return
 
         # Load the json files
@@ -124,6 +148,7 @@ class Topology:
         self.tile_size = (topo_json["tile_size"]["x"], topo_json["tile_size"]["y"])
         self.user_demand = topo_json["user_demand"]
         self.density_grid = np.array(topo_json["density"])
+        self.terrain = None
 
         self.pylons = {
             (pylon["pos"]["x"], pylon["pos"]["y"]): Pylon((pylon["pos"]["x"], pylon["pos"]["y"]), pylon["pos"]["h"], -1)
@@ -135,7 +160,9 @@ class Topology:
                 model["power"],
                 model["gain"],
                 model["bandwidth"],
-                model["range"]
+                model["frequency"],
+                model["range"],
+                model.get("fov", 360)
             ) for model in antennas_json
         ]
 
@@ -157,18 +184,126 @@ class Topology:
         # Add users and their associated pylons (None in the first place)
         self.users = {tuple(u): User(tuple(u), None, self.user_demand) for u in users}
 
-        max_reach:float = np.max(list(map(lambda a: a.reach, self.antennas)))
-
         for p in self.pylons.keys():
             self.graph.add_vertex(p, 0.)
-            for u in users:
-                d = dist2(p,u)
-                if d <= max_reach:
-                    self.graph.add_edge(p, u, d)
+        self.build_edges()
+        self.edge_store.add_to_graph(self.graph)
 
         # Export the graph for future plotting
         write_log(self.graph)
 
+    def reset_allocation(self) -> None:
+        """Remove the current allocation: users unassociated, no allocated bandwidth and no antenna model."""
+        for u, user in self.users.items():
+            user.pylon = None
+            self.graph.vertices[u] = 0.
+        for p, pylon in self.pylons.items():
+            pylon.antenna_type = -1
+            pylon.sectors = 1
+            self.graph.vertices[p] = 0.
+
+    def build_edges(self, lazy:bool=False) -> None:
+        """Build the edge store from the current users, pylons and antenna models.
+
+        The edges are built once within the maximum reach of all the antenna models,
+        the reach of a given model is then applied by the edge store itself.
+
+        Parameters
+        ----------
+        lazy
+            Generate the edges of a pylon only when they are requested instead of storing all of them.
+        """
+        reaches = [ a.reach for a in self.antennas ]
+        sectors = [ a.sectors for a in self.antennas ]
+        if lazy:
+            self.edge_store = LazyEdgeProvider(self.users.keys(), self.pylons.keys(), reaches, sectors)
+        else:
+            self.edge_store = EdgeStore(self.users.keys(), self.pylons.keys(), reaches, sectors)
+
+
+def build_topology(equipments:list[object], towers:list[object], antennas:list[object], lazy_edges:bool=False) -> Topology:
+    """Build a topology and its network graph from loaded JSON files.
+
+    Parameters
+    ----------
+    equipments
+        JSON loaded array of UEs.
+    towers
+        JSON loaded array of towers.
+    antennas
+        JSON loaded array of antenna models.
+    lazy_edges
+        Generate the edges of a tower only when they are requested.
+
+    Returns
+    -------
+    Topology with unassociated users and pylons without antenna model.
+    """
+    topo = Topology()
+
+    topo.antennas = [
+        AntennaModel(
+            a["name"],
+            a["power"],
+            a["gain"],
+            a["bandwidth"],
+            a["frequency"],
+            a["range"],
+            a.get("fov", 360)
+        )
+        for a in antennas
+    ]
+    topo.pylons = {
+        (t["pos"]["x"], t["pos"]["y"]): Pylon(
+            (t["pos"]["x"], t["pos"]["y"]),
+            t["pos"]["h"],
+            -1 # Antenna type has not been set yet
+        )
+        for t in towers
+    }
+    topo.users = {
+        (u["pos"]["x"], u["pos"]["y"]): User(
+            (u["pos"]["x"], u["pos"]["y"]),
+            None,# Unassociated user
+            u["demand"]
+        )
+        for u in equipments
+    }
+
+    # Build the network graph
+    topo.graph = WeightedGraph()
+
+    ## Add UEs to the graph
+    for u in topo.users.keys():
+        topo.graph.add_vertex(u, 0.)
+
+    ## Add the towers to the graph and build the edges once for every antenna model
+    for t in topo.pylons.keys():
+        topo.graph.add_vertex(t, 0.)
+    topo.build_edges(lazy_edges)
+
+    return topo
+
+
+def pylon_bandwidth(topo:Topology, p:tuple[float,float]) -> float:
+    """Total bandwidth of a pylon, the bandwidth of its antenna model times its number of sectors in use.
+
+    The sectors of a pylon reuse the same frequencies, each one having the whole bandwidth of the model.
+
+    Parameters
+    ----------
+    topo
+        Topology object, the pylon must have an antenna model.
+    p
+        Position of the pylon.
+
+    Returns
+    -------
+    Bandwidth in Hz.
+    """
+    pylon = topo.pylons[p]
+    return topo.antennas[pylon.antenna_type].bandwidth * pylon.sectors
+
 
 def pathloss_oh(topo:Topology, p:tuple[float,float], u:tuple[float,float]) -> float:
     """Okumura-Hata path loss model.
@@ -229,6 +364,117 @@ def pathloss_simple(topo:Topology, p:tuple[float,float], u:tuple[float,float]) -
     return PL0 + eta*np.log10(dist2(p,u))
 
 
+ue_height:float = 1.5
+"""Height of the UEs above the surface in meters."""
+
+
+def pathloss_oh_terrain(topo:Topology, p:tuple[float,float], u:tuple[float,float]) -> float:
+    """Okumura-Hata path loss model with the effective height of the BS above the UE given by the terrain.
+
+    The effective height is the height of the pylon plus the surface height at the
+    pylon, minus the surface height at the UE (at least 1 meter). Without terrain it
+    is the same as `pathloss_oh`.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    p
+        Position of the BS.
+    u
+        Position of the UE, or tuple of x and y coordinates arrays.
+
+    Returns
+    -------
+    Path loss value in decibels.
+    """
+    if topo.terrain is None:
+        return pathloss_oh(topo, p, u)
+    antenna = topo.antennas[topo.pylons[p].antenna_type]
+    f = antenna.frequency / 1e6 # Convert frequency to MHz
+    H = np.maximum(topo.pylons[p].height + topo.terrain.sample(p[0], p[1]) - topo.terrain.sample(u[0], u[1]), 1.)
+    d = dist2(p,u) / 1000 # Convert distance between BS and UE to kilometers
+    return 69.55 + 26.16*np.log10(f) - 13.82*np.log10(H) + (44.9 - 6.55*np.log10(H)) * np.log10(d)
+
+
+def pathloss_terrain(topo:Topology, p:tuple[float,float], u:tuple[float,float], samples:int=32) -> float:
+    """Free Space Path Loss model plus the diffraction loss of the terrain and buildings along the link.
+
+    The surface is sampled along the link and the loss of its most obstructing point
+    is added as a single knife-edge (ITU-R P.526 approximation). Without terrain it is
+    the same as `pathloss_fs`.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    p
+        Position of the BS.
+    u
+        Position of the UE, or tuple of x and y coordinates arrays.
+    samples
+        Number of surface samples along each link.
+
+    Returns
+    -------
+    Path loss value in decibels.
+    """
+    PL = pathloss_fs(topo, p, u)
+    if topo.terrain is None:
+        return PL
+    antenna = topo.antennas[topo.pylons[p].antenna_type]
+    wavelength = 3*10**8 / antenna.frequency
+    xs = np.asarray(u[0], dtype=float).reshape(-1)
+    ys = np.asarray(u[1], dtype=float).reshape(-1)
+
+    # Height of the line of sight above each sample of the surface profiles, all links at once
+    t = np.arange(1, samples+1) / (samples+1)
+    start = np.reshape(topo.pylons[p].height + topo.terrain.sample(p[0], p[1]), (-1, 1))
+    end = ue_height + topo.terrain.sample(xs, ys).reshape(-1, 1)
+    clearance = topo.terrain.profile(p, xs, ys, samples) - (start + (end - start) * t)
+
+    # Fresnel-Kirchhoff parameter of the most obstructing sample
+    d = np.maximum(dist2(p, (xs, ys)), 1.).reshape(-1, 1)
+    v = np.max(clearance * np.sqrt(2 / (wavelength * d * t * (1 - t))), axis=1)
+    J = np.where(v > -.78, 6.9 + 20*np.log10(np.sqrt((v - .1)**2 + 1) + v - .1), 0.)
+    return PL + J.reshape(np.shape(PL))
+
+
+pathloss_models:dict[str, Callable[[Topology, tuple[float,float], tuple[float,float]], float]] = {
+    "oh": pathloss_oh,
+    "fs": pathloss_fs,
+    "simple": pathloss_simple,
+    "oh-terrain": pathloss_oh_terrain,
+    "terrain": pathloss_terrain
+}
+"""Available path loss models by command line name."""
+
+
+def link_budget(topo:Topology, p:tuple[float,float], u:tuple[float,float], pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> float:
+    """Received signal power at a UE from a BS.
+
+    The path loss models only use numpy operations, so `u` can also be a tuple
+    of coordinates arrays `(xs, ys)` to compute the link budget of many UEs at once.
+
+    Parameters
+    ----------
+    topo
+        Topology object.
+    p
+        Position of the BS.
+    u
+        Position of the UE, or tuple of x and y coordinates arrays.
+    pathloss
+        Path loss model to use.
+
+    Returns
+    -------
+    Received signal power in dBm (array of values if `u` holds arrays).
+    """
+    antenna = topo.antennas[topo.pylons[p].antenna_type]
+    return antenna.power + antenna.gain - pathloss(topo, p, u)
+
+
 def snr(topo:Topology, p:tuple[int,int], u:tuple[int,int], pathloss:Callable[[Topology, tuple[float,float], tuple[float,float]], float]) -> float:
     """Signal to Noise Ratio (SNR) not taking interferences between BS into account.
 
@@ -249,7 +495,7 @@ def snr(topo:Topology, p:tuple[int,int], u:tuple[int,int], pathloss:Callable[[To
     """
     antenna = topo.antennas[topo.pylons[p].antenna_type]
     N0 = -174 # dBm/Hz
-    SdB = antenna.power + antenna.gain - pathloss(topo, p,u)
+    SdB = link_budget(topo, p, u, pathloss)
     NdB = N0 + 10*np.log10(antenna.bandwidth)
     return np.power(10, (SdB - NdB)/10)
 
@@ -336,3 +582,69 @@ def Wcost_prime(w:float, C:float, N0:float, S:float) -> float:
     Derivative of the cost function.
     """
     return 10/np.log(10) * ( 1/w - C*np.log(2) / (w*w) * ( 1 + 1 / (np.power(2, C/w) - 1)) )
+
+
+def Wsolve(C:np.ndarray, N0:np.ndarray, S:np.ndarray, bracket:tuple[float,float]=(1, 1e22), iterations:int=64) -> np.ndarray:
+    """Vectorized root of the cost function, the bandwidth to allocate for many links at once.
+
+    The cost function is decreasing, so a bisection on the logarithm of the
+    bandwidth inside the same bracket as the scalar solver is used.
+
+    Parameters
+    ----------
+    C
+        User equipment demands in bits per second.
+    N0
+        Noise densities in dBm/Hz.
+    S
+        Signal powers in dB.
+    bracket
+        Bandwidth interval to search the root in, in Hz.
+    iterations
+        Number of bisection steps.
+
+    Returns
+    -------
+    Bandwidth to allocate in Hz, `np.inf` where the cost function has no root.
+    """
+    C, N0, S = np.broadcast_arrays(np.asarray(C, dtype=float), np.asarray(N0, dtype=float), np.asarray(S, dtype=float))
+    # The bisection loop runs in a compiled kernel when Numba is installed
+    W = solve_bandwidth(
+        np.ascontiguousarray(C.ravel()), np.ascontiguousarray(N0.ravel()), np.ascontiguousarray(S.ravel()),
+        np.log(bracket[0]), np.log(bracket[1]), iterations
+    )
+    return W.reshape(C.shape)
+
+
+def Wlambert(C:np.ndarray, N0:np.ndarray, S:np.ndarray, bracket:tuple[float,float]=(1, 1e22)) -> np.ndarray:
+    """Closed form root of the cost function, the same bandwidths as `Wsolve` without iterating.
+
+    With `x = C*ln(2)/w` and `a = 10^((S-N0)/10) / (C*ln(2))`, the root solves
+    `exp(x) - 1 = a*x`, whose positive solution is `x = -1/a - W_{-1}(-exp(-1/a)/a)`
+    with `W_{-1}` the lower branch of the Lambert W function. It is cheaper than the
+    bisection on small arrays, when a few links are solved at a time.
+
+    Parameters
+    ----------
+    C
+        User equipment demands in bits per second.
+    N0
+        Noise densities in dBm/Hz.
+    S
+        Signal powers in dB.
+    bracket
+        Bandwidth interval of the roots kept, in Hz.
+
+    Returns
+    -------
+    Bandwidth to allocate in Hz, `np.inf` where the cost function has no root in the bracket.
+    """
+    from scipy.special import lambertw # Imported on first use to keep the library import fast
+
+    C, N0, S = np.broadcast_arrays(np.asarray(C, dtype=float), np.asarray(N0, dtype=float), np.asarray(S, dtype=float))
+    a = np.power(10., (S - N0) / 10) / (C * np.log(2))
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        x = -1/a - lambertw(-np.exp(-1/a) / a, -1).real
+        W = C * np.log(2) / x
+    # No root if the limit at infinity is positive (a < 1)
+    return np.where((a >= 1) & (W >= bracket[0]) & (W <= bracket[1]), W, np.inf)
@@ -1,4 +1,4 @@
-from numpy import dstack, ndarray
+from numpy import dstack, ndarray, arctan2, degrees, intp, minimum
 from numpy.random import uniform
 
 def dist2(u:tuple[int,int], v:tuple[int,int]) -> float:
@@ -18,6 +18,43 @@ def dist2(u:tuple[int,int], v:tuple[int,int]) -> float:
     return ((u[0]-v[0])**2 + (u[1]-v[1])**2)**0.5
 
 
+def azimuth(p:tuple[float,float], xs:ndarray, ys:ndarray) -> ndarray:
+    """Vectorized direction of points seen from a pylon.
+
+    Parameters
+    ----------
+    p
+        Position of the pylon.
+    xs
+        X positions of the points.
+    ys
+        Y positions of the points.
+
+    Returns
+    -------
+    Azimuth of each point in degrees in [0, 360), counterclockwise from the x axis.
+    """
+    return degrees(arctan2(ys - p[1], xs - p[0])) % 360.
+
+
+def sector_index(azimuths:ndarray, sectors:int) -> ndarray:
+    """Sector containing each azimuth, the sectors split the circle evenly starting from the x axis.
+
+    Parameters
+    ----------
+    azimuths
+        Azimuths in degrees in [0, 360).
+    sectors
+        Number of sectors.
+
+    Returns
+    -------
+    Sector index of each azimuth.
+    """
+    # The minimum guards against the rounding of azimuths right below 360
+    return minimum((azimuths * (sectors / 360.)).astype(intp), sectors - 1)
+
+
 def sample_users(tile_size:tuple[float,float], density:int) -> ndarray:
     """Sample end users in a tile from a given density.
 
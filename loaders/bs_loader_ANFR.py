@@ -3,6 +3,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from lib.progress import track
 from lib.gps import lyon_coords, gps_to_float, gps_dist
 
 from os import path
@@ -84,7 +85,7 @@ def save_bs_ANFR_data(df: pd.DataFrame, output_filepath: str) -> None:
     with open(output_filepath, "w") as f:
         f.write("[\n")
         i = 1
-        for index, row in df.iterrows():
+        for index, row in track(df.iterrows(), "Converting ANFR towers", df.shape[0]):
             x = gps_dist(
                 lyon_coords["min"]["lat"], lyon_coords["min"]["lon"],
                 row['latitude'], lyon_coords["min"]["lon"]
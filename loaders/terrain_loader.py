@@ -0,0 +1,37 @@
+from sys import argv
+from os import makedirs
+from os.path import splitext, dirname
+from lib.arg_parser import parse_arguments
+from lib.terrain import synthetic_terrain, convert_ascii_grid
+
+
+if __name__ == "__main__":
+    args = parse_arguments(
+        [
+            ("--out", "Sets the JSON terrain file to write, the raster is written to the .npy file of the same name (default: data/terrain/synthetic.json)", str),
+            ("--asc", "Converts the given ESRI ASCII grid (.asc DEM tile) instead of generating a synthetic terrain", str),
+            ("--origin", "Sets the 'x,y' position of the lower left corner of the raster in meters (default: 0,0 or the grid corner)", str),
+            ("--size", "Sets the 'rows,columns' size of the synthetic raster (default: 600,600)", str),
+            ("--resolution", "Sets the size in meters of a synthetic raster cell (default: 5)", float),
+            ("--buildings", "Sets the number of synthetic buildings (default: 2000)", int),
+            ("--seed", "Sets the random seed of the synthetic terrain", int)
+        ],
+        argv,
+        "== Python tool to build the memory-mapped terrain rasters used by the terrain pathloss models =="
+    )
+
+    out_file = args.get("--out", "data/terrain/synthetic.json")
+    raster_file = splitext(out_file)[0] + ".npy"
+    makedirs(dirname(out_file) or ".", exist_ok=True)
+    origin = tuple(map(float, args["--origin"].split(","))) if "--origin" in args else None
+
+    if "--asc" in args:
+        terrain = convert_ascii_grid(args["--asc"], raster_file, origin)
+    else:
+        rows, cols = map(int, args.get("--size", "600,600").split(","))
+        terrain = synthetic_terrain(
+            raster_file, (rows, cols), args.get("--resolution", 5.), origin or (0., 0.),
+            buildings=args.get("--buildings", 2000), seed=args.get("--seed")
+        )
+    terrain.save(out_file)
+    print(f"Saved a {terrain.heights.shape[1]}x{terrain.heights.shape[0]} terrain raster ({terrain.resolution}m cells) to {raster_file}")
@@ -5,6 +5,7 @@ import seaborn as sns
 
 from lib.gps import lyon_coords, inspireID_to_floats, gps_dist
 from lib.util import sample_users
+from lib.progress import Progress
 
 from os import path
 
@@ -78,7 +79,7 @@ def load_ue_data(csv_filepath: str) -> pd.DataFrame:
     return lyon_tiles
 
 
-def save_ue_data(df: pd.DataFrame, output_filepath: str) -> None:
+def save_ue_data(df: pd.DataFrame, output_filepath: str, aggregate: bool = False) -> None:
     """Save the UE data to a JSON file.
     The JSON file can then be used to create a network graph.
 
@@ -88,7 +89,12 @@ def save_ue_data(df: pd.DataFrame, output_filepath: str) -> None:
         The DataFrame to save
     output_filepath
         The output JSON file path
+    aggregate
+        Write a single weighted UE at the center of each square, with the demand of
+        all its individuals and their sampled positions in a "users" field, instead
+        of writing every individual as its own UE
     """
+    progress = Progress("Sampling UEs from the squares", df.shape[0])
     with open(output_filepath, "w") as f:
         f.write("[\n")
         i = 1
@@ -102,17 +108,28 @@ def save_ue_data(df: pd.DataFrame, output_filepath: str) -> None:
                 lyon_coords["min"]["lat"], lyon_coords["min"]["lon"],
                 lyon_coords["min"]["lat"], row["longitude"]
             )
+
             # Sample UEs from the square
             UEs = []
             samples = sample_users((200.,200.), int(row['ind']))
             for sample in samples:
                 UEs.append((x + sample[0], y + sample[1]))
 
+            if aggregate:
+                # The positions of the individuals are kept to split the allocation back to them
+                users = ", ".join(f"[{ux}, {uy}]" for ux,uy in UEs)
+                f.write(f'    {{"pos": {{"x": {x + 100.}, "y": {y + 100.}}}, "demand": {len(UEs) * 1e6}, "users": [{users}]}}{"," if i < df.shape[0] else ""}\n')
+                i+=1
+                progress.update()
+                continue
+
             # Generate string for the user
             for j, (x,y) in enumerate(UEs):
                 f.write(f'    {{"pos": {{"x": {x}, "y": {y}}}, "demand": 1e6}}{"," if i < df.shape[0] or j < len(UEs)-1 else ""}\n')
             i+=1
+            progress.update()
         f.write("]\n")
+    progress.close()
 
 
 # Only when in script mode
@@ -131,5 +148,8 @@ if __name__ == "__main__":
     # Count squares with less than 10 individuals
     # TODO
 
-    # Export data to JSON
-    save_ue_data(df, "./data/equipments/lyon_equipments_INSEE.json")
+    # Export data to JSON, one weighted UE per square with --aggregate
+    if "--aggregate" in argv:
+        save_ue_data(df, "./data/equipments/lyon_equipments_INSEE_aggregated.json", aggregate=True)
+    else:
+        save_ue_data(df, "./data/equipments/lyon_equipments_INSEE.json")
@@ -3,11 +3,11 @@ from sys import argv
 import json
 import numpy as np
 from datetime import datetime
-from math import log10
 from os.path import isfile, join, dirname
 from lib.graph import WeightedGraph, WeightedEdge
 from lib.util import  dist2
 from lib.arg_parser import parse_arguments
+from lib.progress import Progress
 
 
 if __name__ == '__main__':
@@ -78,34 +78,26 @@ if __name__ == '__main__':
     max_reach:float = np.max([ model["range"] for model in antennas_json ])
 
     # Verbose variables
-    i=1
     towers_len:int = len(towers_json)
-    towers_log:int = int(log10(towers_len)+1)
     users_len:int = len(users)
-    users_log:int = int(log10(users_len)+1)
 
-    if "--verbose" in args:
-        print(f"\rAdding towers vertices ({i:{towers_log}}/{towers_len}) - ({0:{users_log}}/{users_len})", end='')
+    # The progress is counted in tower-UE pairs and only printed a few times per second
+    progress = Progress("Adding towers vertices (tower-UE pairs)", towers_len*users_len, enabled="--verbose" in args)
     for tower in towers_json:
         t = (tower['pos']['x'], tower['pos']['y'])
         graph.add_vertex(t, 0.)# weight is for the allocated bandwidth
-        if "--verbose" in args:
-            print(f"\rAdding towers vertices ({i:{towers_log}}/{towers_len}) - ({0:{users_log}}/{users_len})", end='')
         # Export tower node and its edges
         f.write(f"{t} ({0.}):\n")
-        for j,u in enumerate(users):
+        for u in users:
             d = dist2(t, u)
             if d <= max_reach:
                 f.write(f"  {WeightedEdge(t, u, 0.)}\n")
                 # graph.add_edge(t, u, d)
-                if "--verbose" in args:
-                    print(f"\rAdding towers vertices ({i:{towers_log}}/{towers_len}) - ({j:{users_log}}/{users_len})", end='')
 
         # Remove added tower from the graph object to reduce memory usage
 
-        i+=1
-    if "--verbose" in args:
-        print('')
+        progress.update(users_len)
+    progress.close()
 
     if "--verbose" in args:
         print(f"Wrote {towers_len} weighted nodes for BSs")